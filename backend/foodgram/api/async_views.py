@@ -0,0 +1,181 @@
+from collections import defaultdict
+from functools import wraps
+
+from api import response_cache
+from api.conditional import recipe_detail, reference_data
+from api.fast_serializers import FastRecipeSerializer
+from api.filters import NameSearchFilter, RecipeFilter
+from api.indexes import ingredient_index
+from api.pagination import CustomPagination
+from api.renderers import FastJSONRenderer
+from api.serializers import (IngredientSerializer, RecipeShowSerializer,
+                             TagSerializer)
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.urls import path
+from recipes.models import Ingredient, Tag
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+# Поля автора в порядке FollowSerializer до recipes и is_subscribed
+FOLLOW_VALUES = ('id', 'email', 'username', 'first_name', 'last_name',
+                 'recipes_count')
+
+
+class Unsupported(Exception):
+    '''Запрос обслуживает синхронный вьюсет'''
+
+
+def async_read(callback, read, params=()):
+    '''
+    Асинхронное чтение для маршрута роутера. Аутентификация, права
+    и выбор рендерера проходят через вьюсет callback, данные читает
+    корутина read асинхронным ORM. Другие методы, параметры вне params,
+    ошибки и Browsable API обслуживает сам callback в потоке.
+    '''
+    fallback = sync_to_async(callback)
+
+    @wraps(read)
+    async def view(request, *args, **kwargs):
+        if (request.method != 'GET'
+                or any(name not in params for name in request.GET)):
+            return await fallback(request, *args, **kwargs)
+        # Как в ViewSetMixin.as_view: методы определяют заголовок Allow
+        viewset = callback.cls(**callback.initkwargs)
+        viewset.action_map = {'head': callback.actions['get'],
+                              **callback.actions}
+        for method, action in viewset.action_map.items():
+            setattr(viewset, method, getattr(viewset, action))
+        viewset.args, viewset.kwargs = args, kwargs
+        drf_request = viewset.initialize_request(request, *args, **kwargs)
+        viewset.request = drf_request
+        viewset.headers = viewset.default_response_headers
+        try:
+            await sync_to_async(viewset.initial)(
+                drf_request, *args, **kwargs)
+            if not isinstance(drf_request.accepted_renderer,
+                              FastJSONRenderer):
+                raise Unsupported
+            response = await read(drf_request, *args, **kwargs)
+        except (APIException, Unsupported):
+            return await fallback(request, *args, **kwargs)
+        response = viewset.finalize_response(
+            drf_request, response, *args, **kwargs)
+        if isinstance(response, Response):
+            response.render()
+        return response
+
+    view.csrf_exempt = True
+    return view
+
+
+async def get_or_unsupported(queryset, pk):
+    '''Объект по pk; ответ 404 отдаёт синхронный вьюсет'''
+    found = await queryset.filter(pk=pk).afirst()
+    if found is None:
+        raise Unsupported
+    return found
+
+
+async def recipe_list(request):
+    async def build():
+        filterset = RecipeFilter(request.query_params,
+                                 FastRecipeSerializer.queryset(),
+                                 request=request)
+        if not filterset.is_valid():
+            raise Unsupported
+        paginator = CustomPagination()
+        rows = await paginator.apaginate_queryset(filterset.qs, request)
+        data = await FastRecipeSerializer(
+            rows, many=True, context={'request': request}).adata()
+        return paginator.get_paginated_response(data)
+
+    return await response_cache.arespond(
+        request, response_cache.list_key(request),
+        response_cache.LIST_DEPENDENCIES, build)
+
+
+@recipe_detail
+async def recipe_retrieve(request, pk):
+    async def build():
+        row = await get_or_unsupported(FastRecipeSerializer.queryset(), pk)
+        return Response(await FastRecipeSerializer(
+            row, context={'request': request}).adata())
+
+    return await response_cache.arespond(
+        request, response_cache.detail_key(request, pk),
+        response_cache.detail_dependencies(pk), build)
+
+
+@reference_data('tags')
+async def tag_list(request):
+    return Response(TagSerializer(
+        [tag async for tag in Tag.objects.all()], many=True).data)
+
+
+@reference_data('tags')
+async def tag_retrieve(request, pk):
+    return Response(TagSerializer(
+        await get_or_unsupported(Tag.objects.all(), pk)).data)
+
+
+@reference_data('ingredients')
+async def ingredient_list(request):
+    name = request.query_params.get(NameSearchFilter.search_param)
+    if name:
+        return HttpResponse(
+            await sync_to_async(ingredient_index.search_json)(name),
+            content_type='application/json')
+    return Response(IngredientSerializer(
+        [ingredient async for ingredient in Ingredient.objects.all()],
+        many=True).data)
+
+
+@reference_data('ingredients')
+async def ingredient_retrieve(request, pk):
+    return Response(IngredientSerializer(
+        await get_or_unsupported(Ingredient.objects.all(), pk)).data)
+
+
+async def subscriptions(request):
+    '''
+    Подписки как в FollowSerializer: авторы страницы и превью их
+    рецептов двумя запросами, prefetch_related асинхронно не работает.
+    '''
+    viewset = request.parser_context['view']
+    paginator = CustomPagination()
+    authors = await paginator.apaginate_queryset(
+        viewset.following().values(*FOLLOW_VALUES), request)
+    previews = defaultdict(list)
+    async for recipe in viewset.preview_recipes().filter(
+            author__in=[author['id'] for author in authors]):
+        previews[recipe.author_id].append(recipe)
+    context = {'request': request}
+    return paginator.get_paginated_response([{
+        **author,
+        'recipes': RecipeShowSerializer(previews[author['id']], many=True,
+                                        context=context).data,
+        'is_subscribed': True,
+    } for author in authors])
+
+
+ROUTES = (
+    ('recipes/', 'recipes-list', recipe_list,
+     response_cache.LIST_PARAMS),
+    ('recipes/<int:pk>/', 'recipes-detail', recipe_retrieve, ()),
+    ('tags/', 'tags-list', tag_list, ()),
+    ('tags/<int:pk>/', 'tags-detail', tag_retrieve, ()),
+    ('ingredients/', 'ingredients-list', ingredient_list,
+     (NameSearchFilter.search_param,)),
+    ('ingredients/<int:pk>/', 'ingredients-detail', ingredient_retrieve,
+     ()),
+    ('users/subscriptions/', 'users-subscriptions', subscriptions,
+     ('page', 'limit', 'recipes_limit')),
+)
+
+
+def urls(router):
+    '''Асинхронные маршруты чтения, подключаются перед роутером'''
+    callbacks = {pattern.name: pattern.callback for pattern in router.urls}
+    return [path(route, async_read(callbacks[name], read, params))
+            for route, name, read, params in ROUTES]
@@ -0,0 +1,110 @@
+import copy
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+SHARED_KEY = 'auth-token:{}'
+
+
+class TokenCache:
+    '''
+    Кеш токен -> пользователь: LRU с TTL в памяти процесса и, если
+    включено, общий кеш Django вторым уровнем. Выход, смена пароля,
+    блокировка и удаление пользователя удаляют его токены из общего
+    кеша и кеша текущего процесса; в других процессах отозванный токен
+    действует не дольше AUTH_TOKEN_CACHE_TTL.
+    '''
+
+    def __init__(self):
+        # Увеличивается при каждом отзыве: токен, прочитанный до отзыва,
+        # не должен попасть в кеш после него
+        self.generation = 0
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = self.shared_hits = self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            generation = self.generation
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], generation
+        token = None
+        if settings.AUTH_TOKEN_CACHE_SHARED:
+            token = cache.get(SHARED_KEY.format(key))
+        if token is None:
+            with self.lock:
+                self.misses += 1
+            return None, generation
+        with self.lock:
+            self.shared_hits += 1
+        self.put(key, token, generation)
+        return token, generation
+
+    def set(self, key, token, generation):
+        if settings.AUTH_TOKEN_CACHE_SHARED:
+            cache.set(SHARED_KEY.format(key), token,
+                      timeout=settings.AUTH_TOKEN_CACHE_TTL)
+        self.put(key, token, generation)
+
+    def put(self, key, token, generation):
+        expires = time.monotonic() + settings.AUTH_TOKEN_CACHE_TTL
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[key] = (expires, token)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, keys):
+        '''Удаляет отозванные токены из обоих уровней'''
+        keys = list(keys)
+        if not keys:
+            return
+        with self.lock:
+            self.generation += 1
+            for key in keys:
+                self.entries.pop(key, None)
+        if settings.AUTH_TOKEN_CACHE_SHARED:
+            cache.delete_many([SHARED_KEY.format(key) for key in keys])
+
+    def stats(self):
+        with self.lock:
+            requests = self.hits + self.shared_hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': settings.AUTH_TOKEN_CACHE_SIZE,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': (round((self.hits + self.shared_hits)
+                                   / requests, 4) if requests else None),
+            }
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''
+    Аутентификация по токену без запроса к БД для известных токенов.
+    Неверные токены не кешируются и проверяются по БД каждый раз.
+    '''
+
+    def authenticate_credentials(self, key):
+        token, generation = token_cache.get(key)
+        if token is None:
+            _, token = super().authenticate_credentials(key)
+            token_cache.set(key, token, generation)
+        # Запросы не должны делить один изменяемый объект пользователя
+        token = copy.copy(token)
+        token.user = copy.copy(token.user)
+        return token.user, token
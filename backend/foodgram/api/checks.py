@@ -0,0 +1,17 @@
+from api.versions import shared_cache
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    '''Кеш ответов сбрасывается только в том процессе, где изменены данные'''
+    if shared_cache():
+        return []
+    return [Warning(
+        'Кеш по умолчанию виден только своему процессу: другие воркеры '
+        'сервера и воркер задач отдают закешированные ответы до истечения '
+        'RESPONSE_CACHE_TIMEOUT.',
+        hint='Укажите общий кеш в CACHE_BACKEND и CACHE_LOCATION, '
+             'например django.core.cache.backends.redis.RedisCache.',
+        id='api.W001',
+    )]
@@ -0,0 +1,135 @@
+import datetime
+from asyncio import iscoroutinefunction
+from functools import wraps
+
+from api.versions import get_version
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Value
+from django.utils import timezone
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+from recipes.models import Recipe
+from users.models import Follow
+
+
+def conditional(etag_func=None, last_modified_func=None, vary=(),
+                **cache_control):
+    '''
+    Условный GET для представления: при совпадении If-None-Match
+    или If-Modified-Since возвращается 304 без запуска сериализаторов.
+    Применяется и к синхронным, и к асинхронным представлениям.
+    '''
+
+    def patch(response):
+        if response.status_code in (200, 304):
+            patch_cache_control(response, **cache_control)
+            if vary:
+                patch_vary_headers(response, vary)
+        return response
+
+    def validators(request, *args, **kwargs):
+        '''ETag и Last-Modified так же, как в condition'''
+        etag = etag_func(request, *args, **kwargs) if etag_func else None
+        last_modified = (last_modified_func(request, *args, **kwargs)
+                         if last_modified_func else None)
+        if last_modified:
+            if not timezone.is_aware(last_modified):
+                last_modified = timezone.make_aware(last_modified,
+                                                    datetime.timezone.utc)
+            last_modified = int(last_modified.timestamp())
+        return (quote_etag(etag) if etag is not None else None,
+                last_modified or None)
+
+    def decorator(func):
+        if iscoroutinefunction(func):
+            # condition не поддерживает корутины, валидаторы обращаются
+            # к БД и кешу, поэтому вычисляются в потоке
+            @wraps(func)
+            async def async_inner(request, *args, **kwargs):
+                etag, last_modified = await sync_to_async(validators)(
+                    request, *args, **kwargs)
+                response = get_conditional_response(
+                    request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = await func(request, *args, **kwargs)
+                if request.method in ('GET', 'HEAD'):
+                    if (last_modified
+                            and not response.has_header('Last-Modified')):
+                        response.headers['Last-Modified'] = http_date(
+                            last_modified)
+                    if etag:
+                        response.headers.setdefault('ETag', etag)
+                return patch(response)
+            return async_inner
+
+        conditional_func = condition(etag_func=etag_func,
+                                     last_modified_func=last_modified_func)(
+            func)
+
+        @wraps(func)
+        def inner(request, *args, **kwargs):
+            return patch(conditional_func(request, *args, **kwargs))
+        return inner
+
+    return decorator
+
+
+def reference_data(name):
+    '''Условный GET для справочника с долгим временем кеширования'''
+    return conditional(
+        etag_func=lambda request, *args, **kwargs: (
+            f'{name}-{get_version(name)}'),
+        public=True,
+        max_age=settings.REFERENCE_CACHE_MAX_AGE,
+    )
+
+
+def recipe_validators(request, pk):
+    '''
+    Дата изменения рецепта и флаги текущего пользователя одним запросом.
+    Результат запоминается в запросе, чтобы ETag и Last-Modified
+    не обращались к БД дважды.
+    '''
+    if not hasattr(request, 'recipe_validators'):
+        user = request.user
+        if user.is_anonymous:
+            is_subscribed = Value(False)
+        else:
+            is_subscribed = Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author')))
+        request.recipe_validators = (
+            Recipe.objects.with_viewer_flags(user)
+            .annotate(is_subscribed=is_subscribed)
+            .filter(pk=pk)
+            .values('updated', 'is_favorited', 'is_in_shopping_cart',
+                    'is_subscribed')
+            .first()
+        ) if str(pk).isdigit() else None
+    return request.recipe_validators
+
+
+def recipe_etag(request, pk):
+    validators = recipe_validators(request, pk)
+    if validators is None:
+        return None
+    flags = ''.join(str(int(validators[flag])) for flag in (
+        'is_favorited', 'is_in_shopping_cart', 'is_subscribed'))
+    return (f'recipe-{pk}-{validators["updated"].timestamp()}-{flags}'
+            f'-{get_version("tags")}-{get_version("ingredients")}')
+
+
+def recipe_last_modified(request, pk):
+    '''Last-Modified только для анонимных ответов без личных флагов'''
+    if request.user.is_authenticated:
+        return None
+    validators = recipe_validators(request, pk)
+    return validators and validators['updated']
+
+
+recipe_detail = conditional(etag_func=recipe_etag,
+                            last_modified_func=recipe_last_modified,
+                            vary=('Authorization',),
+                            no_cache=True)
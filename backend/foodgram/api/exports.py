@@ -0,0 +1,113 @@
+import csv
+from itertools import islice
+from tempfile import TemporaryFile
+from uuid import uuid4
+
+from api.pdf import PDFWriter
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from recipes.models import RecipeIngredient, ShoppingListItem
+from users.models import User
+
+SHOP_LIST = 'Список покупок:'
+BY_RECIPE = 'По рецептам:'
+CHUNK_SIZE = 2000
+FILE = 'shopping_list.{}'
+
+
+def total_rows(user):
+    '''Суммарные количества из сохранённого списка покупок'''
+    return (
+        ShoppingListItem.objects.filter(user=user)
+        .values_list('ingredient__name', 'amount',
+                     'ingredient__measurement_unit')
+        .order_by('ingredient__name')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def recipe_rows(user):
+    '''Ингредиенты каждого рецепта из корзины'''
+    return (
+        RecipeIngredient.objects.filter(recipe__shopping_cart__user=user)
+        .values_list('recipe_id', 'recipe__name', 'ingredient__name',
+                     'amount', 'ingredient__measurement_unit')
+        .order_by('recipe__name', 'recipe_id', 'ingredient__name')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def text_lines(user):
+    yield SHOP_LIST
+    for name, amount, unit in total_rows(user):
+        yield f'{name} - {amount}/{unit}'
+    yield ''
+    yield BY_RECIPE
+    current = None
+    for recipe_id, recipe, name, amount, unit in recipe_rows(user):
+        # Рецепты с одинаковым названием выводятся раздельно
+        if recipe_id != current:
+            current = recipe_id
+            yield f'{recipe}:'
+        yield f'    {name} - {amount}/{unit}'
+
+
+def export_txt(user):
+    for line in text_lines(user):
+        yield f'{line}\n'
+
+
+class Echo:
+    '''Буфер для csv.writer, возвращающий записанную строку'''
+
+    def write(self, value):
+        return value
+
+
+def export_csv(user):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Раздел', 'Рецепт', 'Ингредиент',
+                           'Количество', 'Единица измерения'))
+    for name, amount, unit in total_rows(user):
+        yield writer.writerow(('Итого', '', name, amount, unit))
+    for _, recipe, name, amount, unit in recipe_rows(user):
+        yield writer.writerow(('Рецепт', recipe, name, amount, unit))
+
+
+def export_pdf(user):
+    return PDFWriter(settings.SHOPPING_LIST_FONT).stream(text_lines(user))
+
+
+EXPORTS = {
+    'txt': export_txt,
+    'csv': export_csv,
+    'pdf': export_pdf,
+}
+
+
+async def aiterate(chunks):
+    '''
+    Выгрузка для StreamingHttpResponse под ASGI. Синхронный итератор
+    Django 4.2 под ASGI собирает в список целиком, а здесь части читаются
+    в потоке пачками по CHUNK_SIZE и отдаются по мере готовности.
+    '''
+    chunks = iter(chunks)
+    take = sync_to_async(lambda: list(islice(chunks, CHUNK_SIZE)))
+    batch = await take()
+    while batch:
+        for chunk in batch:
+            yield chunk
+        batch = await take()
+
+
+def save_export(user_id, fmt):
+    '''Фоновая выгрузка списка покупок в файл'''
+    user = User.objects.get(pk=user_id)
+    with TemporaryFile() as file:
+        for chunk in EXPORTS[fmt](user):
+            file.write(chunk.encode() if isinstance(chunk, str) else chunk)
+        name = default_storage.save(
+            f'exports/{uuid4().hex}/{FILE.format(fmt)}', File(file))
+    return {'url': default_storage.url(name)}
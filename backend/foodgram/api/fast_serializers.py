@@ -0,0 +1,106 @@
+from collections import defaultdict
+
+from api.fields import rendition_urls
+from api.viewer import viewer_state
+from recipes.models import Recipe, RecipeIngredient
+
+# Поля строки рецепта; date и favourites_count нужны пагинации по ключу
+RECIPE_VALUES = ('id', 'name', 'image', 'text', 'cooking_time', 'date',
+                 'favourites_count', 'author_id', 'author__email',
+                 'author__username', 'author__first_name',
+                 'author__last_name')
+
+
+class FastRecipeSerializer:
+    '''
+    Чтение рецептов из строк .values() без полей DRF.
+    Теги и ингредиенты страницы загружаются двумя запросами в словари,
+    вывод совпадает с RecipeGetSerializer побайтно, это проверяет
+    команда check_fast_serializers.
+    '''
+
+    def __init__(self, instance=None, many=False, context=None):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+    @staticmethod
+    def queryset():
+        return Recipe.objects.values(*RECIPE_VALUES)
+
+    @property
+    def data(self):
+        rows = self.rows()
+        tags, ingredients = self.related([row['id'] for row in rows])
+        return self.result(self.represent(rows, tags, ingredients))
+
+    async def adata(self):
+        '''data для асинхронных представлений, instance - готовые строки'''
+        rows = self.rows()
+        tags, ingredients = self.related([row['id'] for row in rows])
+        await viewer_state(self.context.get('request')).aload()
+        return self.result(self.represent(
+            rows, [row async for row in tags],
+            [row async for row in ingredients]))
+
+    def rows(self):
+        return list(self.instance) if self.many else [self.instance]
+
+    def result(self, recipes):
+        return recipes if self.many else recipes[0]
+
+    @staticmethod
+    def related(ids):
+        '''Запросы тегов и ингредиентов рецептов страницы'''
+        tags = Recipe.tags.through.objects.filter(
+            recipe_id__in=ids,
+        ).order_by('tag_id').values_list('recipe_id', 'tag_id', 'tag__name',
+                                         'tag__color', 'tag__slug')
+        ingredients = RecipeIngredient.objects.filter(
+            recipe_id__in=ids,
+        ).order_by('pk').values_list('recipe_id', 'ingredient_id', 'amount',
+                                     'ingredient__name',
+                                     'ingredient__measurement_unit')
+        return tags, ingredients
+
+    def represent(self, rows, tag_rows, ingredient_rows):
+        tags = defaultdict(list)
+        for recipe_id, *tag in tag_rows:
+            tags[recipe_id].append(dict(zip(('id', 'name', 'color', 'slug'),
+                                            tag)))
+        ingredients = defaultdict(list)
+        for recipe_id, *ingredient in ingredient_rows:
+            ingredients[recipe_id].append(dict(zip(
+                ('id', 'amount', 'name', 'measurement_unit'), ingredient)))
+        request = self.context.get('request')
+        state = viewer_state(request)
+        storage = Recipe._meta.get_field('image').storage
+        return [{
+            'id': row['id'],
+            'tags': tags[row['id']],
+            'author': {
+                'id': row['author_id'],
+                'email': row['author__email'],
+                'username': row['author__username'],
+                'first_name': row['author__first_name'],
+                'last_name': row['author__last_name'],
+                'is_subscribed': state.is_subscribed(row['author_id']),
+            },
+            'ingredients': ingredients[row['id']],
+            'is_favorited': state.is_favorited(row['id']),
+            'is_in_shopping_cart': state.is_in_shopping_cart(row['id']),
+            'name': row['name'],
+            'image': self.image_url(storage, row['image'], request),
+            'renditions': (rendition_urls(row['image'], storage, request)
+                           if row['image'] else None),
+            'text': row['text'],
+            'cooking_time': row['cooking_time'],
+        } for row in rows]
+
+    @staticmethod
+    def image_url(storage, name, request):
+        '''Как serializers.ImageField при UPLOADED_FILES_USE_URL'''
+        if not name:
+            return None
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request else url
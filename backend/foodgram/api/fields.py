@@ -1,7 +1,30 @@
 import base64
+from itertools import zip_longest
 
+from django.core.exceptions import ValidationError
 from django.core.files.base import ContentFile
+from recipes import renditions
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS, ManyRelatedField
+
+CHUNK_SIZE = 64 * 1024
+
+
+def same_content(stored, uploaded):
+    """Совпадает ли загруженный файл с уже сохранённым"""
+    try:
+        if stored.size != uploaded.size:
+            return False
+        with stored.open('rb') as file:
+            uploaded.seek(0)
+            return all(
+                left == right for left, right in zip_longest(
+                    iter(lambda: file.read(CHUNK_SIZE), b''),
+                    iter(lambda: uploaded.read(CHUNK_SIZE), b'')))
+    except OSError:
+        return False
+    finally:
+        uploaded.seek(0)
 
 
 class Base64ImageField(serializers.ImageField):
@@ -13,3 +36,72 @@ class Base64ImageField(serializers.ImageField):
             ext = format.split('/')[-1]
             data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
         return super().to_internal_value(data)
+
+
+def rendition_urls(image_name, storage, request=None):
+    """
+    Ссылки на готовые версии изображения по размерам и форматам.
+    Версии создаёт воркер, до этого поле равно None.
+    """
+    names = renditions.existing(image_name, storage)
+    if names is None:
+        return None
+    return {
+        size: {
+            fmt: (request.build_absolute_uri(storage.url(name))
+                  if request else storage.url(name))
+            for fmt, name in formats.items()
+        }
+        for size, formats in names.items()
+    }
+
+
+class RenditionsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные версии фото рецепта"""
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        return rendition_urls(value.name, value.storage,
+                              self.context.get('request'))
+
+
+class BulkManyRelatedField(ManyRelatedField):
+    """Список связанных объектов, загружаемых одним запросом"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        return self.child_relation.to_internal_values(data)
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Первичные ключи, при many=True проверяемые одним запросом IN"""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_internal_values(self, data):
+        queryset = self.get_queryset()
+        pks = []
+        for value in data:
+            if self.pk_field is not None:
+                value = self.pk_field.to_internal_value(value)
+            try:
+                if isinstance(value, bool):
+                    raise ValidationError(value)
+                pks.append(queryset.model._meta.pk.to_python(value))
+            except ValidationError:
+                self.fail('incorrect_type', data_type=type(value).__name__)
+        objects = queryset.in_bulk(pks)
+        for pk in pks:
+            if pk not in objects:
+                self.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
@@ -1,32 +1,80 @@
-from django.contrib.auth import get_user_model
+from django import forms
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework
-from recipes.models import Recipe
+from django_filters.widgets import QueryArrayWidget
+from recipes import search
+from recipes.models import Favourite, Recipe, ShoppingCart
 from rest_framework.filters import SearchFilter
 
-User = get_user_model()
-
 
 class NameSearchFilter(SearchFilter):
     search_param = 'name'
 
 
+class SlugListFilter(rest_framework.Filter):
+    '''
+    Список слагов из ?tags=a&tags=b.
+    Варианты не загружаются из БД, неизвестный слаг просто не совпадёт.
+    '''
+
+    field_class = forms.Field
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', QueryArrayWidget)
+        super().__init__(*args, **kwargs)
+
+
 class RecipeFilter(rest_framework.FilterSet):
-    author = rest_framework.ModelChoiceFilter(queryset=User.objects.all())
-    tags = rest_framework.AllValuesMultipleFilter(field_name='tags__slug')
+    '''
+    Все условия - подзапросы по уникальным индексам связей, поэтому
+    рецепты не дублируются и не нужен DISTINCT. Частые теги проверяются
+    EXISTS при чтении по дате, избранное и корзина пользователя - IN:
+    рецепты ищутся по индексу (user, recipe), а не перебором всей ленты.
+    '''
+
+    POPULAR = 'popular'
+    # Совпадает с индексом recipe_popular
+    POPULAR_ORDERING = ('-favourites_count', '-date', '-pk')
+
+    author = rest_framework.NumberFilter(field_name='author_id')
+    tags = SlugListFilter(method='filter_tags')
     is_favorited = rest_framework.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = rest_framework.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = rest_framework.CharFilter(method='filter_search')
+    ordering = rest_framework.ChoiceFilter(
+        choices=((POPULAR, 'По популярности'),), method='filter_ordering')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ordering')
+
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'), tag__slug__in=value)))
 
     def filter_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(favourites__user=self.request.user)
+            return queryset.filter(pk__in=Favourite.objects.filter(
+                user=self.request.user).values('recipe'))
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(shopping_cart__user=self.request.user)
+            return queryset.filter(pk__in=ShoppingCart.objects.filter(
+                user=self.request.user).values('recipe'))
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        value = value.strip()
+        if not value:
+            return queryset
+        return search.search(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        if value == self.POPULAR:
+            return queryset.order_by(*self.POPULAR_ORDERING)
         return queryset
@@ -0,0 +1,192 @@
+import heapq
+import json
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import timedelta
+from itertools import chain, groupby
+from operator import itemgetter
+from threading import Lock
+
+from api.versions import get_version
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+# Запас на расхождение часов и транзакции, зафиксированные
+# позже своего времени изменения
+CATCH_UP_MARGIN = timedelta(minutes=1)
+CHUNK_SIZE = 10000
+
+
+class IngredientIndex:
+    '''
+    Префиксный индекс названий ингредиентов в памяти процесса.
+    Хранит отсортированные по casefold названия и готовые JSON-фрагменты,
+    перестраивается при смене версии набора ингредиентов.
+    '''
+
+    version_name = 'ingredients'
+
+    def __init__(self):
+        self.version = None
+        self.entries = ([], [])
+        self.lock = Lock()
+
+    def build(self):
+        rows = sorted(
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit'),
+            key=lambda row: (row[1].casefold(), row[0]))
+        keys = [name.casefold() for _, name, _ in rows]
+        fragments = [
+            json.dumps({'id': pk, 'name': name, 'measurement_unit': unit},
+                       ensure_ascii=False, separators=(',', ':'))
+            for pk, name, unit in rows
+        ]
+        self.entries = (keys, fragments)
+
+    def refresh(self):
+        version = get_version(self.version_name)
+        if version == self.version:
+            return
+        with self.lock:
+            if version != self.version:
+                self.build()
+                self.version = version
+
+    def search(self, prefix, limit=None):
+        '''JSON-фрагменты ингредиентов, название которых начинается с prefix'''
+        self.refresh()
+        prefix = prefix.strip().casefold()
+        limit = limit or settings.INGREDIENTS_SEARCH_LIMIT
+        keys, fragments = self.entries
+        result = []
+        index = bisect_left(keys, prefix)
+        while (index < len(keys) and len(result) < limit
+               and keys[index].startswith(prefix)):
+            result.append(fragments[index])
+            index += 1
+        return result
+
+    def search_json(self, prefix, limit=None):
+        return '[' + ','.join(self.search(prefix, limit)) + ']'
+
+
+def grow(sizes, recipe_id):
+    '''Дополняет массив нулями до позиции recipe_id'''
+    if recipe_id >= len(sizes):
+        sizes.frombytes(bytes(sizes.itemsize * (recipe_id + 1 - len(sizes))))
+
+
+class PantryIndex:
+    '''
+    Обратный индекс ингредиент -> отсортированный array('I') id рецептов
+    и число ингредиентов каждого рецепта в array('H') по его id.
+    При смене версии рецептов догружает только изменённые рецепты.
+    '''
+
+    version_name = 'recipes'
+
+    def __init__(self):
+        self.version = None
+        self.synced_at = None
+        self.postings = {}
+        self.sizes = array('H')
+        self.lock = Lock()
+
+    def build(self):
+        synced_at = timezone.now()
+        last_id = Recipe.objects.aggregate(last=Max('id'))['last'] or 0
+        postings = {}
+        sizes = array('H')
+        grow(sizes, last_id)
+        rows = (RecipeIngredient.objects
+                .values_list('ingredient_id', 'recipe_id')
+                .order_by('ingredient_id', 'recipe_id')
+                .iterator(chunk_size=CHUNK_SIZE))
+        for ingredient_id, group in groupby(rows, key=itemgetter(0)):
+            recipe_ids = array('I', (recipe_id for _, recipe_id in group))
+            postings[ingredient_id] = recipe_ids
+            for recipe_id in recipe_ids:
+                grow(sizes, recipe_id)
+                sizes[recipe_id] += 1
+        self.postings, self.sizes = postings, sizes
+        self.synced_at = synced_at
+
+    def catch_up(self):
+        '''Перечитывает рецепты, изменённые после прошлой синхронизации'''
+        synced_at = timezone.now()
+        recipe_ids = list(Recipe.objects.filter(
+            updated__gte=self.synced_at - CATCH_UP_MARGIN,
+        ).values_list('id', flat=True))
+        rows = (RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+                .values_list('recipe_id', 'ingredient_id')
+                .order_by('recipe_id'))
+        ingredients = {recipe_id: [] for recipe_id in recipe_ids}
+        for recipe_id, ingredient_id in rows:
+            ingredients[recipe_id].append(ingredient_id)
+        for recipe_id, ingredient_ids in ingredients.items():
+            self.discard(recipe_id)
+            self.add(recipe_id, ingredient_ids)
+        self.synced_at = synced_at
+
+    def add(self, recipe_id, ingredient_ids):
+        for ingredient_id in ingredient_ids:
+            insort(self.postings.setdefault(ingredient_id, array('I')),
+                   recipe_id)
+        grow(self.sizes, recipe_id)
+        self.sizes[recipe_id] = len(ingredient_ids)
+
+    def discard(self, recipe_id):
+        '''Удаляет рецепт из всех списков, ингредиентов немного'''
+        if recipe_id >= len(self.sizes) or not self.sizes[recipe_id]:
+            return
+        for recipe_ids in self.postings.values():
+            index = bisect_left(recipe_ids, recipe_id)
+            if index < len(recipe_ids) and recipe_ids[index] == recipe_id:
+                del recipe_ids[index]
+        self.sizes[recipe_id] = 0
+
+    def refresh(self):
+        version = get_version(self.version_name)
+        if version == self.version:
+            return
+        with self.lock:
+            if version != self.version:
+                if self.version is None:
+                    self.build()
+                else:
+                    self.catch_up()
+                self.version = version
+
+    def search(self, ingredient_ids, min_coverage=0, limit=None):
+        '''
+        Рецепты по доле их ингредиентов, имеющихся у пользователя:
+        список (id, доля, число недостающих) по убыванию доли.
+        '''
+        self.refresh()
+        limit = limit or settings.PANTRY_RESULTS_LIMIT
+        with self.lock:
+            sizes = self.sizes
+            matches = Counter(chain.from_iterable(
+                self.postings.get(ingredient_id, ())
+                for ingredient_id in set(ingredient_ids)))
+            ranked = heapq.nlargest(limit, (
+                (count / sizes[recipe_id], -(sizes[recipe_id] - count),
+                 recipe_id)
+                for recipe_id, count in matches.items()
+                if sizes[recipe_id] and count / sizes[recipe_id]
+                >= min_coverage))
+        return [(recipe_id, coverage, -missing)
+                for coverage, missing, recipe_id in ranked]
+
+    def forget(self, recipe_ids):
+        '''Удаляет рецепты, удалённые в других процессах'''
+        with self.lock:
+            for recipe_id in recipe_ids:
+                self.discard(recipe_id)
+
+
+ingredient_index = IngredientIndex()
+pantry_index = PantryIndex()
@@ -0,0 +1,472 @@
+import json
+import re
+import statistics
+import tempfile
+import time
+import tracemalloc
+from io import StringIO
+from itertools import takewhile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from jobs.queue import run_next
+from recipes.models import Favourite, Ingredient, Recipe, ShoppingCart, Tag
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import Follow, User
+
+BASELINE = Path(settings.BASE_DIR) / 'benchmark_baseline.json'
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAf'
+         'FcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==')
+PASSWORD = 'benchmark-password'
+
+# Допустимое число запросов к БД для каждого маршрута.
+# Не должно зависеть от объёма данных.
+# Токен аутентифицируется из кеша, кроме первого запроса после выхода.
+# Изменение набора данных увеличивает его версию в БД одним запросом.
+# Удаление рецепта вычитает его из списков покупок одним агрегатом.
+QUERY_BUDGETS = {
+    'recipes-list': 6,
+    'recipes-list-cached': 1,
+    'recipes-list-cached-anonymous': 0,
+    'recipes-list-limit-50': 5,
+    'recipes-list-filtered': 5,
+    'recipes-list-cursor': 4,
+    'recipes-search': 5,
+    'recipes-popular': 5,
+    'recipes-pantry': 6,
+    'recipes-detail': 5,
+    'recipes-detail-not-modified': 1,
+    'recipes-create': 19,
+    'recipes-patch': 19,
+    'recipes-delete': 14,
+    'favorite-add': 4,
+    'favorite-remove': 6,
+    'shopping-cart-add': 11,
+    'shopping-cart-remove': 13,
+    'download-shopping-cart': 2,
+    'download-shopping-cart-csv': 2,
+    'download-shopping-cart-pdf': 2,
+    'export-shopping-cart': 1,
+    'jobs-detail': 1,
+    'tags-list': 1,
+    'tags-list-not-modified': 0,
+    'tags-detail': 1,
+    'ingredients-search': 1,
+    'ingredients-detail': 1,
+    'users-list': 3,
+    'users-detail': 2,
+    'users-me': 1,
+    'subscriptions': 3,
+    'feed': 6,
+    'feed-cursor': 5,
+    'subscribe': 9,
+    'unsubscribe': 8,
+    'token-login': 3,
+    'token-logout': 4,
+}
+
+# Частые сочетания фильтров списка рецептов для проверки планов запросов.
+# Третий элемент: допустим ли обход рецептов по индексу сортировки. Он
+# годится только для частых условий, где LIMIT страницы прерывает обход;
+# редкие условия (автор, избранное, корзина) должны искать рецепты по
+# индексу (SEARCH, Index Cond).
+EXPLAIN_ROUTES = (
+    ('все', '/api/recipes/', True),
+    ('автор', '/api/recipes/?author={author}', False),
+    ('теги', '/api/recipes/?tags={tag}', True),
+    ('избранное', '/api/recipes/?is_favorited=1', False),
+    ('корзина', '/api/recipes/?is_in_shopping_cart=1', False),
+    ('теги и избранное', '/api/recipes/?tags={tag}&is_favorited=1', False),
+    ('автор и теги', '/api/recipes/?author={author}&tags={tag}', False),
+    ('популярные', '/api/recipes/?ordering=popular', True),
+)
+PAGE_LIMIT = re.compile(r'LIMIT \d+$')
+# Чтение всей таблицы рецептов: SQLite без индекса и Postgres Seq Scan
+FULL_SCAN = re.compile(r'SCAN recipes_recipe$|Seq Scan on recipes_recipe',
+                       re.MULTILINE)
+# Обход рецептов по индексу без условия поиска в нём
+INDEX_SCAN = re.compile(r'SCAN recipes_recipe USING'
+                        r'|Index (?:Only )?Scan (?:Backward )?using \S+ '
+                        r'on recipes_recipe')
+# Сортировка без индекса допустима только для найденных по индексу строк
+UNORDERED = re.compile(r'TEMP B-TREE FOR ORDER BY|Sort Key')
+
+
+def bad_plan(plan, ordered_scan):
+    '''
+    Причина, по которой план не годится, или None. Postgres Index Scan
+    с Index Cond - поиск, без него - обход всего индекса.
+    '''
+    if FULL_SCAN.search(plan):
+        return 'полный просмотр recipes_recipe'
+    lines = plan.splitlines()
+    for index, line in enumerate(lines):
+        if not INDEX_SCAN.search(line):
+            continue
+        details = takewhile(lambda detail: '->' not in detail,
+                            lines[index + 1:])
+        if any('Index Cond' in detail for detail in details):
+            continue
+        if not ordered_scan:
+            return 'обход recipes_recipe по индексу вместо поиска'
+        if UNORDERED.search(plan):
+            return 'сортировка при обходе recipes_recipe'
+    return None
+
+
+def shared_caches(location):
+    return {'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(Path(location) / 'cache'),
+    }}
+
+
+class Command(BaseCommand):
+    '''
+    Бенчмарк API: число запросов к БД, задержка и память.
+    Данные создаются в отдельной тестовой базе и удаляются после прогона.
+    Выполнить команду python manage.py benchmark
+    '''
+
+    help = 'Замер числа запросов, задержки и памяти для маршрутов API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Подписок на пользователя')
+        parser.add_argument('--favourites', type=int, default=20,
+                            help='Избранных рецептов на пользователя')
+        parser.add_argument('--cart', type=int, default=10,
+                            help='Рецептов в корзине на пользователя')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Зерно генератора данных generate_data')
+        parser.add_argument('--baseline', default=str(BASELINE))
+        parser.add_argument('--save-baseline', action='store_true')
+        parser.add_argument('--tolerance', type=float, default=1.5,
+                            help='Допустимый рост p95 относительно базы')
+        parser.add_argument('--explain', action='store_true',
+                            help='Проверить планы запросов фильтров')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as media:
+                # Общий кеш, как в развёртывании с несколькими процессами
+                with override_settings(MEDIA_ROOT=media, ALLOWED_HOSTS=['*'],
+                                       CACHES=shared_caches(media)):
+                    self.seed(options)
+                    results = self.run_routes(options['repeat'])
+                    bad_plans = (self.explain() if options['explain']
+                                 else [])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        self.report(results)
+        if bad_plans:
+            raise CommandError(
+                f'Запросы без индекса: {", ".join(bad_plans)}')
+        self.check_results(results, options)
+
+    def seed(self, options):
+        call_command('import_db', stdout=StringIO())
+        call_command(
+            'generate_data', stdout=StringIO(), users=options['users'],
+            recipes=options['recipes'], follows=options['follows'],
+            favourites=options['favourites'], cart=options['cart'],
+            min_ingredients=options['ingredients_per_recipe'],
+            max_ingredients=options['ingredients_per_recipe'],
+            images=1, seed=options['seed'])
+        users = list(User.objects.order_by('pk')[:2])
+        tags = list(Tag.objects.all())
+        ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+        self.user = users[0]
+        self.user.set_password(PASSWORD)
+        self.user.save()
+        self.client = APIClient()
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.recipe = self.create_recipe(tags, ingredient_ids[:5])
+        # Версии изображений к моменту замеров уже создал воркер
+        while run_next():
+            pass
+        self.other = Recipe.objects.exclude(author=self.user).first()
+        for model in (Favourite, ShoppingCart):
+            model.objects.filter(user=self.user, recipe=self.other).delete()
+        # Фильтры избранного и корзины не должны давать пустую страницу:
+        # у пользователя из generate_data этих строк может не быть
+        tagged = Recipe.objects.filter(tags=tags[0]).exclude(
+            pk=self.other.pk).order_by('pk')
+        for model, count in ((Favourite, options['favourites']),
+                             (ShoppingCart, options['cart'])):
+            for recipe in tagged[:max(count, 1)]:
+                model.objects.get_or_create(user=self.user, recipe=recipe)
+        self.author = users[1]
+        Follow.objects.filter(user=self.user, author=self.author).delete()
+        self.tags = tags
+        self.ingredient_ids = ingredient_ids
+
+    def create_recipe(self, tags, ingredient_ids):
+        response = self.client.post('/api/recipes/', {
+            'name': 'Рецепт бенчмарка',
+            'text': 'Текст',
+            'cooking_time': 10,
+            'image': IMAGE,
+            'tags': [tag.pk for tag in tags],
+            'ingredients': [{'id': pk, 'amount': 10}
+                            for pk in ingredient_ids],
+        }, format='json')
+        if response.status_code != 201:
+            raise CommandError(f'Не удалось создать рецепт: {response.data}')
+        return response
+
+    def routes(self):
+        '''Маршруты в виде (имя, вызов, ожидаемый статус)'''
+        client, recipe, other = self.client, self.recipe.data, self.other
+        created = []
+        jobs = []
+
+        def create():
+            response = self.create_recipe(self.tags, self.ingredient_ids[:5])
+            created.append(response.data['id'])
+            return response
+
+        def login():
+            return APIClient().post('/api/auth/token/login/', {
+                'email': self.user.email, 'password': PASSWORD})
+
+        def logout():
+            token = APIClient().post('/api/auth/token/login/', {
+                'email': self.user.email,
+                'password': PASSWORD}).data['auth_token']
+            logout_client = APIClient()
+            logout_client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+            with CaptureQueriesContext(connection) as queries:
+                response = logout_client.post('/api/auth/token/logout/')
+            response.queries = len(queries)
+            # Выход удаляет общий токен пользователя, восстанавливаем его.
+            Token.objects.create(user=self.user, key=self.token.key)
+            return response
+
+        def export():
+            response = client.post('/api/recipes/export_shopping_cart/',
+                                   {'format': 'csv'})
+            jobs.append(response.data['id'])
+            return response
+
+        def deep_page():
+            url = '/api/recipes/?cursor=&limit=10'
+            for _ in range(3):
+                url = client.get(url).data['next'] or url
+            return lambda: client.get(url)
+
+        def not_modified(url):
+            etag = client.get(url)['ETag']
+            return lambda: client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        tag = self.tags[0].slug
+        return (
+            ('recipes-list', lambda: client.get('/api/recipes/'), 200),
+            # Повтор того же списка отдаётся из кеша ответов
+            ('recipes-list-cached', lambda: client.get('/api/recipes/'), 200),
+            ('recipes-list-cached-anonymous',
+             lambda: APIClient().get('/api/recipes/'), 200),
+            ('recipes-list-limit-50',
+             lambda: client.get('/api/recipes/?limit=50'), 200),
+            ('recipes-list-filtered', lambda: client.get(
+                f'/api/recipes/?tags={tag}&is_favorited=1'), 200),
+            ('recipes-list-cursor', deep_page(), 200),
+            ('recipes-search', lambda: client.get(
+                '/api/recipes/?search=рецепт профилирования'), 200),
+            ('recipes-popular', lambda: client.get(
+                '/api/recipes/?ordering=popular'), 200),
+            ('recipes-pantry', lambda: client.get(
+                '/api/recipes/pantry/?ingredients=' + ','.join(
+                    map(str, self.ingredient_ids[:30]))), 200),
+            ('recipes-detail',
+             lambda: client.get(f'/api/recipes/{other.pk}/'), 200),
+            ('recipes-detail-not-modified',
+             not_modified(f'/api/recipes/{other.pk}/'), 304),
+            ('recipes-create', create, 201),
+            ('recipes-patch', lambda: client.patch(
+                f'/api/recipes/{recipe["id"]}/', {
+                    'name': 'Новое название',
+                    'tags': [self.tags[0].pk],
+                    'ingredients': [{'id': pk, 'amount': 20}
+                                    for pk in self.ingredient_ids[:5]],
+                }, format='json'), 200),
+            ('recipes-delete', lambda: client.delete(
+                f'/api/recipes/{created.pop()}/'), 204),
+            ('favorite-add', lambda: client.post(
+                f'/api/recipes/{other.pk}/favorite/'), 201),
+            ('favorite-remove', lambda: client.delete(
+                f'/api/recipes/{other.pk}/favorite/'), 204),
+            ('shopping-cart-add', lambda: client.post(
+                f'/api/recipes/{other.pk}/shopping_cart/'), 201),
+            ('shopping-cart-remove', lambda: client.delete(
+                f'/api/recipes/{other.pk}/shopping_cart/'), 204),
+            ('download-shopping-cart', lambda: client.get(
+                '/api/recipes/download_shopping_cart/'), 200),
+            ('download-shopping-cart-csv', lambda: client.get(
+                '/api/recipes/download_shopping_cart/?format=csv'), 200),
+            ('download-shopping-cart-pdf', lambda: client.get(
+                '/api/recipes/download_shopping_cart/?format=pdf'), 200),
+            ('export-shopping-cart', export, 202),
+            ('jobs-detail',
+             lambda: client.get(f'/api/jobs/{jobs[-1]}/'), 200),
+            ('tags-list', lambda: client.get('/api/tags/'), 200),
+            ('tags-list-not-modified', not_modified('/api/tags/'), 304),
+            ('tags-detail',
+             lambda: client.get(f'/api/tags/{self.tags[0].pk}/'), 200),
+            ('ingredients-search',
+             lambda: client.get('/api/ingredients/?name=аб'), 200),
+            ('ingredients-detail', lambda: client.get(
+                f'/api/ingredients/{self.ingredient_ids[0]}/'), 200),
+            ('users-list', lambda: client.get('/api/users/'), 200),
+            ('users-detail', lambda: client.get(
+                f'/api/users/{self.author.pk}/'), 200),
+            ('users-me', lambda: client.get('/api/users/me/'), 200),
+            ('subscriptions', lambda: client.get(
+                '/api/users/subscriptions/?recipes_limit=3'), 200),
+            ('feed', lambda: client.get('/api/users/feed/'), 200),
+            ('feed-cursor', lambda: client.get(
+                '/api/users/feed/?cursor='), 200),
+            ('subscribe', lambda: client.post(
+                f'/api/users/{self.author.pk}/subscribe/'), 201),
+            ('unsubscribe', lambda: client.delete(
+                f'/api/users/{self.author.pk}/subscribe/'), 204),
+            ('token-login', login, 200),
+            ('token-logout', logout, 204),
+        )
+
+    def run_routes(self, repeat):
+        routes = self.routes()
+        results = {name: {'queries': 0, 'latency': [], 'memory': 0}
+                   for name, _, _ in routes}
+        tracemalloc.start()
+        try:
+            for _ in range(repeat):
+                # Маршруты выполняются по кругу, чтобы пары
+                # создание/удаление оставляли данные неизменными.
+                for name, call, expected in routes:
+                    tracemalloc.reset_peak()
+                    before = tracemalloc.get_traced_memory()[0]
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        response = call()
+                        if response.streaming:
+                            b''.join(response.streaming_content)
+                        elapsed = time.perf_counter() - started
+                    peak = tracemalloc.get_traced_memory()[1] - before
+                    if expected and response.status_code != expected:
+                        raise CommandError(
+                            f'{name}: статус {response.status_code}, '
+                            f'ожидался {expected}')
+                    result = results[name]
+                    result['queries'] = max(
+                        result['queries'],
+                        getattr(response, 'queries', len(queries)))
+                    result['latency'].append(elapsed * 1000)
+                    result['memory'] = max(result['memory'], peak)
+        finally:
+            tracemalloc.stop()
+        return {
+            name: {
+                'queries': result['queries'],
+                'p50': statistics.median(result['latency']),
+                'p95': percentile(result['latency'], 95),
+                'memory_kb': result['memory'] / 1024,
+            }
+            for name, result in results.items()
+        }
+
+    def explain(self):
+        '''
+        Планы основного запроса списка рецептов для частых фильтров.
+        В Postgres последовательное чтение запрещается, чтобы на малых
+        тестовых данных проверялось наличие индексного плана.
+        '''
+        bad_plans = []
+        postgres = connection.vendor == 'postgresql'
+        for name, url, ordered_scan in EXPLAIN_ROUTES:
+            url = url.format(author=self.other.author_id,
+                             tag=self.tags[0].slug)
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            sql = next((query['sql'] for query in queries.captured_queries
+                        if query['sql'].startswith('SELECT "recipes_recipe"')
+                        and PAGE_LIMIT.search(query['sql'])), None)
+            if sql is None:
+                raise CommandError(
+                    f'{name}: не найден запрос страницы рецептов {url}')
+            with connection.cursor() as cursor:
+                if postgres:
+                    cursor.execute('SET enable_seqscan = off')
+                    cursor.execute(f'EXPLAIN {sql}')
+                else:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = '\n'.join(str(row[-1]) for row in cursor.fetchall())
+                if postgres:
+                    cursor.execute('RESET enable_seqscan')
+            self.stdout.write(f'{name}: {url}\n{plan}\n')
+            reason = bad_plan(plan, ordered_scan)
+            if reason:
+                bad_plans.append(f'{name} ({reason})')
+        return bad_plans
+
+    def report(self, results):
+        self.stdout.write(f'{"route":<30}{"queries":>8}{"budget":>8}'
+                          f'{"p50 ms":>10}{"p95 ms":>10}{"mem KiB":>10}')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<30}{result["queries"]:>8}'
+                f'{QUERY_BUDGETS.get(name, "-"):>8}'
+                f'{result["p50"]:>10.2f}{result["p95"]:>10.2f}'
+                f'{result["memory_kb"]:>10.1f}')
+
+    def check_results(self, results, options):
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            with open(baseline_path, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f'База сохранена в {baseline_path}')
+            return
+        baseline = {}
+        if baseline_path.exists():
+            with open(baseline_path, encoding='utf-8') as f:
+                baseline = json.load(f)
+        errors = []
+        for name, result in results.items():
+            budget = QUERY_BUDGETS.get(name)
+            if budget is not None and result['queries'] > budget:
+                errors.append(f'{name}: {result["queries"]} запросов '
+                              f'при бюджете {budget}')
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result['queries'] > base['queries']:
+                errors.append(f'{name}: {result["queries"]} запросов, '
+                              f'в базе {base["queries"]}')
+            if result['p95'] > base['p95'] * options['tolerance']:
+                errors.append(f'{name}: p95 {result["p95"]:.2f} мс, '
+                              f'в базе {base["p95"]:.2f} мс')
+        if errors:
+            raise CommandError('\n'.join(errors))
+        self.stdout.write(self.style.SUCCESS('Все маршруты в пределах норм'))
+
+
+def percentile(values, percent):
+    '''Перцентиль по методу ближайшего ранга'''
+    ordered = sorted(values)
+    index = max(0, -(-len(ordered) * percent // 100) - 1)
+    return ordered[int(index)]
@@ -0,0 +1,262 @@
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from importlib.util import find_spec
+from urllib.parse import quote
+
+from api.management.commands.benchmark import percentile
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from recipes.models import Ingredient, Recipe
+from rest_framework.authtoken.models import Token
+from users.models import Follow
+
+# Профиль развёртывания: аргументы gunicorn и окружение процесса
+PROFILES = {
+    'wsgi': (['foodgram.wsgi:application'],
+             {'ASYNC_READ_VIEWS': 'False'}),
+    'asgi': (['foodgram.asgi:application',
+              '--worker-class', 'uvicorn.workers.UvicornWorker'],
+             {'ASYNC_READ_VIEWS': 'True'}),
+}
+ROUTES = (
+    '/api/recipes/',
+    '/api/recipes/?page=2',
+    '/api/recipes/{recipe}/',
+    '/api/tags/',
+    '/api/ingredients/?name={prefix}',
+    '/api/users/subscriptions/',
+)
+# Медленный клиент отправляет тело входа по байту, держа соединение
+SLOW_PATH = '/api/auth/token/login/'
+SLOW_LENGTH = 1 << 20
+SLOW_INTERVAL = 0.5
+STARTUP_TIMEOUT = 30
+MEMORY_INTERVAL = 0.2
+
+
+class Command(BaseCommand):
+    '''
+    Сравнение развёртываний WSGI (синхронные воркеры gunicorn) и ASGI
+    (gunicorn с воркерами uvicorn и асинхронным чтением): пропускная
+    способность, задержка и память при разном числе одновременных
+    соединений. Серверы запускаются на текущей базе, данные должны быть
+    созданы заранее командой generate_data.
+    Выполнить команду python manage.py benchmark_servers
+    '''
+
+    help = 'Пропускная способность и память WSGI и ASGI под нагрузкой'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', choices=PROFILES,
+                            default=list(PROFILES))
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, nargs='+',
+                            default=[1, 10, 50, 200],
+                            help='Числа одновременных соединений')
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Секунд нагрузки на каждое число соединений')
+        parser.add_argument('--slow-clients', type=int, default=0,
+                            help='Соединений, медленно отправляющих тело')
+        parser.add_argument('--host', default='localhost',
+                            help='Заголовок Host запросов')
+
+    def handle(self, *args, **options):
+        recipe = Recipe.objects.order_by('pk').first()
+        follower = Follow.objects.order_by('pk').values_list(
+            'user', flat=True).first()
+        if recipe is None or follower is None:
+            raise CommandError('Нет данных: generate_data')
+        ingredient = Ingredient.objects.order_by('pk').first()
+        token, _ = Token.objects.get_or_create(user_id=follower)
+        self.host = options['host']
+        self.headers = {'Authorization': f'Token {token.key}'}
+        self.paths = [route.format(
+            recipe=recipe.pk,
+            prefix=quote(ingredient.name[:2] if ingredient else ''),
+        ) for route in ROUTES]
+        bodies, results = {}, []
+        for profile in options['profiles']:
+            if profile == 'asgi' and find_spec('uvicorn') is None:
+                self.stderr.write('asgi пропущен: pip install uvicorn')
+                continue
+            port = free_port()
+            server = self.start(profile, port, options['workers'])
+            try:
+                self.wait(server, port)
+                bodies[profile] = asyncio.run(self.snapshot(port))
+                for concurrency in options['concurrency']:
+                    results.append((profile, concurrency, asyncio.run(
+                        self.load(port, server.pid, concurrency,
+                                  options['duration'],
+                                  options['slow_clients']))))
+            finally:
+                server.terminate()
+                server.wait()
+        self.report(results)
+        self.compare(bodies)
+
+    def start(self, profile, port, workers):
+        args, env = PROFILES[profile]
+        return subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', *args,
+             '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+             '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env={**os.environ, **env})
+
+    def wait(self, server, port):
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'Сервер завершился с кодом '
+                                   f'{server.returncode}')
+            try:
+                status, _ = asyncio.run(self.fetch(port, self.paths[0]))
+            except OSError:
+                time.sleep(0.2)
+                continue
+            if status == 200:
+                return
+            raise CommandError(f'{self.paths[0]}: ответ {status}')
+        raise CommandError('Сервер не запустился')
+
+    async def fetch(self, port, path):
+        '''GET с Connection: close, тело читается до закрытия соединения'''
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        headers = ''.join(f'{name}: {value}\r\n'
+                          for name, value in self.headers.items())
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: {self.host}\r\n'
+                     f'{headers}Connection: close\r\n\r\n'.encode())
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        head, _, body = response.partition(b'\r\n\r\n')
+        if b'transfer-encoding: chunked' in head.lower():
+            body = unchunk(body)
+        return int(head.split(None, 2)[1]), body
+
+    async def snapshot(self, port):
+        return {path: await self.fetch(port, path) for path in self.paths}
+
+    async def load(self, port, pid, concurrency, duration, slow_clients):
+        latencies = []
+        errors = 0
+        peak_kb = 0
+        deadline = time.monotonic() + duration
+
+        async def client(index):
+            nonlocal errors
+            while time.monotonic() < deadline:
+                path = self.paths[index % len(self.paths)]
+                index += 1
+                start = time.perf_counter()
+                try:
+                    status, _ = await self.fetch(port, path)
+                except OSError:
+                    errors += 1
+                    continue
+                if status == 200:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                else:
+                    errors += 1
+
+        async def slow_client():
+            reader, writer = await asyncio.open_connection(
+                '127.0.0.1', port)
+            writer.write(f'POST {SLOW_PATH} HTTP/1.1\r\n'
+                         f'Host: {self.host}\r\n'
+                         f'Content-Type: application/json\r\n'
+                         f'Content-Length: {SLOW_LENGTH}\r\n'
+                         f'Connection: close\r\n\r\n'.encode())
+            while time.monotonic() < deadline:
+                writer.write(b' ')
+                await writer.drain()
+                await asyncio.sleep(SLOW_INTERVAL)
+            writer.close()
+
+        async def memory():
+            nonlocal peak_kb
+            while time.monotonic() < deadline:
+                peak_kb = max(peak_kb, rss_kb(pid))
+                await asyncio.sleep(MEMORY_INTERVAL)
+
+        slow = [asyncio.ensure_future(slow_client())
+                for _ in range(slow_clients)]
+        # Медленные клиенты занимают воркеры до начала замера
+        await asyncio.sleep(SLOW_INTERVAL if slow else 0)
+        deadline = time.monotonic() + duration
+        await asyncio.gather(memory(), *(client(index)
+                                         for index in range(concurrency)))
+        await asyncio.gather(*slow, return_exceptions=True)
+        return {
+            'rps': len(latencies) / duration,
+            'p50': statistics.median(latencies) if latencies else None,
+            'p95': percentile(latencies, 95) if latencies else None,
+            'errors': errors,
+            'rss_mb': peak_kb / 1024,
+        }
+
+    def report(self, results):
+        self.stdout.write(f'{"profile":<8}{"conn":>6}{"req/s":>10}'
+                          f'{"p50 ms":>10}{"p95 ms":>10}{"errors":>8}'
+                          f'{"RSS MiB":>10}')
+        for profile, concurrency, result in results:
+            p50, p95 = (f'{result[name]:.2f}' if result[name] is not None
+                        else '-' for name in ('p50', 'p95'))
+            self.stdout.write(
+                f'{profile:<8}{concurrency:>6}{result["rps"]:>10.1f}'
+                f'{p50:>10}{p95:>10}{result["errors"]:>8}'
+                f'{result["rss_mb"]:>10.1f}')
+
+    def compare(self, bodies):
+        '''Оба развёртывания должны отдавать одинаковые ответы'''
+        if len(bodies) < 2:
+            return
+        (first, expected), *others = bodies.items()
+        mismatches = [f'{profile} {path}'
+                      for profile, responses in others
+                      for path, response in responses.items()
+                      if response != expected[path]]
+        if mismatches:
+            raise CommandError(f'Ответы отличаются от {first}: '
+                               + ', '.join(mismatches))
+        self.stdout.write(self.style.SUCCESS('Ответы профилей совпадают'))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def rss_kb(pid):
+    '''RSS процесса и всех его потомков по /proc, КиБ; 0 вне Linux'''
+    total, pids = 0, [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f'/proc/{current}/status') as status:
+                total += next((int(line.split()[1]) for line in status
+                               if line.startswith('VmRSS:')), 0)
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return total
+
+
+def unchunk(body):
+    '''Тело ответа с Transfer-Encoding: chunked'''
+    chunks = []
+    while body:
+        size, _, body = body.partition(b'\r\n')
+        size = int(size.split(b';')[0], 16)
+        if not size:
+            break
+        chunks.append(body[:size])
+        body = body[size + 2:]
+    return b''.join(chunks)
@@ -0,0 +1,83 @@
+from api.fast_serializers import FastRecipeSerializer
+from api.renderers import FastJSONRenderer
+from api.serializers import RecipeGetSerializer
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import BaseCommand, CommandError
+from recipes.models import Favourite, Recipe
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from users.models import User
+
+ORDERING = ('-date', '-pk')
+
+
+class Command(BaseCommand):
+    '''
+    Проверка побайтного совпадения быстрого пути чтения рецептов
+    с RecipeGetSerializer и JSONRenderer для анонима и пользователей
+    с избранным. Выполнить команду python manage.py check_fast_serializers
+    '''
+
+    help = 'Сравнение FastRecipeSerializer и FastJSONRenderer с эталонными'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=500,
+                            help='Число последних рецептов для сравнения')
+        parser.add_argument('--users', type=int, default=5,
+                            help='Число пользователей, кроме анонима')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        ids = list(Recipe.objects.order_by(*ORDERING).values_list(
+            'pk', flat=True)[:options['recipes']])
+        if not ids:
+            raise CommandError('Нет рецептов: generate_data')
+        user_ids = Favourite.objects.order_by('user').values_list(
+            'user', flat=True).distinct()[:options['users']]
+        viewers = [AnonymousUser(), *User.objects.filter(pk__in=user_ids)]
+        size = options['batch_size']
+        mismatches = 0
+        for viewer in viewers:
+            request = Request(APIRequestFactory().get('/api/recipes/'))
+            request.user = viewer
+            context = {'request': request}
+            for start in range(0, len(ids), size):
+                batch = ids[start:start + size]
+                mismatches += self.compare(batch, context, viewer)
+        checked = len(ids) * len(viewers)
+        if mismatches:
+            raise CommandError(
+                f'Расхождений: {mismatches} из {checked} рецептов')
+        self.stdout.write(self.style.SUCCESS(
+            f'Совпадают все {checked} рецептов, '
+            f'{len(viewers)} пользователей'))
+
+    def compare(self, batch, context, viewer):
+        expected = RecipeGetSerializer(
+            Recipe.objects.for_read().filter(pk__in=batch).order_by(
+                *ORDERING),
+            many=True, context=context).data
+        fast = FastRecipeSerializer(
+            FastRecipeSerializer.queryset().filter(pk__in=batch).order_by(
+                *ORDERING),
+            many=True, context=context).data
+        if len(fast) != len(expected):
+            self.stderr.write(f'{viewer}: {len(fast)} рецептов вместо '
+                              f'{len(expected)}')
+            return len(batch)
+        reference = JSONRenderer()
+        mismatches = 0
+        for recipe, candidate in zip(expected, fast):
+            rendered = reference.render(recipe)
+            for name, output in (
+                ('values', reference.render(candidate)),
+                ('orjson', FastJSONRenderer().render(candidate)),
+            ):
+                if output != rendered:
+                    mismatches += 1
+                    self.stderr.write(
+                        f'{viewer}, рецепт {recipe["id"]}, {name}:\n'
+                        f'  {rendered.decode()}\n  {output.decode()}')
+                    break
+        return mismatches
@@ -0,0 +1,250 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+from recipes import counters, feed, shopping_list
+from recipes.models import (Favourite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import Follow, User
+
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+PASSWORD = 'synthetic-password'
+# Даты рецептов отсчитываются назад от фиксированного момента, чтобы
+# одинаковый seed давал одинаковые данные в любой день
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def zipf_weights(size, exponent):
+    '''Накопленные веса распределения Ципфа для рангов 1..size'''
+    return list(accumulate(1 / rank ** exponent
+                           for rank in range(1, size + 1)))
+
+
+@contextmanager
+def explicit_dates():
+    '''Позволяет задавать даты рецептов при bulk_create'''
+    fields = [Recipe._meta.get_field(name) for name in ('date', 'updated')]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    '''
+    Генерация синтетических данных для профилирования.
+    Нужны загруженные ингредиенты (python manage.py import_db).
+    Выполнить команду python manage.py generate_data --users 10000
+    --recipes 1000000
+    '''
+
+    help = 'Генерация пользователей, рецептов, подписок, избранного и корзин'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Среднее число подписок на пользователя')
+        parser.add_argument('--favourites', type=int, default=30,
+                            help='Среднее число избранных на пользователя')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='Среднее число рецептов в корзине')
+        parser.add_argument('--min-ingredients', type=int, default=3)
+        parser.add_argument('--max-ingredients', type=int, default=15)
+        parser.add_argument('--images', type=int, default=20,
+                            help='Число изображений-заглушек')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Период публикации рецептов в днях')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Показатель распределения Ципфа')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.seed = options['seed']
+        self.rnd = random.Random(self.seed)
+        self.batch_size = options['batch_size']
+        self.ingredient_ids = list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True))
+        if not self.ingredient_ids:
+            raise CommandError('Сначала загрузите ингредиенты: import_db')
+        # Популярность ингредиента не должна зависеть от алфавита
+        self.rnd.shuffle(self.ingredient_ids)
+        started = time.perf_counter()
+        tags = self.tags()
+        images = self.images(options['images'])
+        users = self.step('Пользователи', self.users, options)
+        recipes = self.step('Рецепты', self.recipes, options, users, tags,
+                            images)
+        self.step('Подписки', self.relations, options, Follow, 'author',
+                  users, users, options['follows'])
+        self.step('Избранное', self.relations, options, Favourite, 'recipe',
+                  users, recipes, options['favourites'])
+        self.step('Корзины', self.relations, options, ShoppingCart, 'recipe',
+                  users, recipes, options['cart'])
+        self.step('Списки покупок', lambda options: shopping_list.rebuild(),
+                  options)
+        self.step('Ленты подписок', lambda options: feed.rebuild(), options)
+        # Пакетная вставка не отправляет сигналы, счётчики пересчитываются
+        self.step('Счётчики', lambda options: counters.reconcile(), options)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.1f} с'))
+
+    def step(self, title, func, options, *args):
+        started = time.perf_counter()
+        try:
+            return func(options, *args)
+        finally:
+            self.stdout.write(
+                f'{title}: {time.perf_counter() - started:.1f} с')
+
+    def bulk_create(self, model, objects, return_ids=False):
+        '''Пакетная вставка, одна транзакция на пакет'''
+        ids = []
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                ids.extend(self.insert(model, batch, return_ids))
+                batch = []
+        ids.extend(self.insert(model, batch, return_ids))
+        return ids
+
+    def insert(self, model, batch, return_ids):
+        with transaction.atomic():
+            created = model.objects.bulk_create(batch)
+        return [obj.pk for obj in created] if return_ids else []
+
+    def tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS)
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def images(self, count):
+        '''Изображения-заглушки, общие для всех рецептов'''
+        # Отдельный генератор: уже сохранённые изображения не должны
+        # сдвигать последовательность, по которой строятся рецепты
+        rnd = random.Random(self.seed)
+        names = []
+        for index in range(max(count, 1)):
+            name = f'recipes/synthetic/{index}.jpg'
+            color = tuple(rnd.randrange(256) for _ in range(3))
+            if not default_storage.exists(name):
+                buffer = BytesIO()
+                Image.new('RGB', (480, 320), color).save(buffer, 'JPEG')
+                name = default_storage.save(name,
+                                            ContentFile(buffer.getvalue()))
+            names.append(name)
+        return names
+
+    def users(self, options):
+        # Имена зависят только от seed и номера, а не от числа
+        # пользователей в таблице
+        prefix = f'synthetic{self.seed}-'
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Данные с seed {self.seed} уже созданы, укажите другой seed')
+        password = make_password(PASSWORD)
+        return self.bulk_create(User, (
+            User(email=f'{prefix}{index}@example.com',
+                 username=f'{prefix}{index}',
+                 first_name=f'Имя{index}',
+                 last_name=f'Фамилия{index}',
+                 password=password)
+            for index in range(options['users'])),
+            return_ids=True)
+
+    def recipes(self, options, users, tags, images):
+        rnd = self.rnd
+        author_weights = zipf_weights(len(users), options['zipf'])
+        ingredient_weights = zipf_weights(len(self.ingredient_ids),
+                                          options['zipf'])
+        period = options['days'] * 24 * 3600
+        recipe_ids = []
+        remaining = options['recipes']
+        with explicit_dates():
+            while remaining > 0:
+                size = min(self.batch_size, remaining)
+                remaining -= size
+                authors = rnd.choices(users, cum_weights=author_weights,
+                                      k=size)
+                batch = []
+                for author in authors:
+                    date = EPOCH - timedelta(seconds=rnd.randrange(period))
+                    batch.append(Recipe(
+                        author_id=author,
+                        name=f'Рецепт {len(recipe_ids) + len(batch)}',
+                        text='Синтетический рецепт для профилирования.',
+                        cooking_time=rnd.randint(5, 180),
+                        image=rnd.choice(images),
+                        date=date,
+                        updated=date,
+                    ))
+                with transaction.atomic():
+                    batch = Recipe.objects.bulk_create(batch)
+                    RecipeIngredient.objects.bulk_create(
+                        (RecipeIngredient(recipe_id=recipe.pk,
+                                          ingredient_id=ingredient_id,
+                                          amount=rnd.randint(1, 500))
+                         for recipe in batch
+                         for ingredient_id in self.sample(
+                             self.ingredient_ids, ingredient_weights,
+                             rnd.randint(options['min_ingredients'],
+                                         options['max_ingredients']))),
+                        batch_size=self.batch_size)
+                    Recipe.tags.through.objects.bulk_create(
+                        (Recipe.tags.through(recipe_id=recipe.pk,
+                                             tag_id=tag_id)
+                         for recipe in batch
+                         for tag_id in rnd.sample(
+                             tags, rnd.randint(1, len(tags)))),
+                        batch_size=self.batch_size)
+                recipe_ids.extend(recipe.pk for recipe in batch)
+        return recipe_ids
+
+    def sample(self, population, cum_weights, count):
+        '''Различные элементы с вероятностями по распределению Ципфа'''
+        count = min(count, len(population))
+        chosen = set()
+        while len(chosen) < count:
+            chosen.update(self.rnd.choices(population,
+                                           cum_weights=cum_weights,
+                                           k=count - len(chosen)))
+        return chosen
+
+    def relations(self, options, model, field, users, targets, average):
+        '''Связи пользователей с популярными по Ципфу объектами'''
+        rnd = self.rnd
+        weights = zipf_weights(len(targets), options['zipf'])
+        field = f'{field}_id'
+
+        limit = len(targets) // 2
+
+        def objects():
+            for user in users:
+                count = min(int(rnd.expovariate(1 / average)) if average
+                            else 0, limit)
+                for target in self.sample(targets, weights, count):
+                    if target != user or model is not Follow:
+                        yield model(user_id=user, **{field: target})
+
+        self.bulk_create(model, objects())
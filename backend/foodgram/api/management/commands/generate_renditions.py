@@ -0,0 +1,25 @@
+from django.core.management import BaseCommand
+from jobs.queue import enqueue
+from recipes import renditions
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    '''
+    Ставит в очередь создание версий изображений рецептов, у которых
+    их ещё нет, например после смены схемы имён версий.
+    Выполнить команду python manage.py generate_renditions
+    '''
+
+    help = 'Создание недостающих версий изображений рецептов воркером'
+
+    def handle(self, *args, **options):
+        queued = 0
+        images = (Recipe.objects.exclude(image='').order_by('image')
+                  .values_list('image', flat=True).distinct())
+        for image in images.iterator():
+            if renditions.missing(image):
+                enqueue('recipes.renditions.ensure', image)
+                queued += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Поставлено в очередь изображений: {queued}'))
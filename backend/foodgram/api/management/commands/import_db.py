@@ -1,25 +1,98 @@
+import csv
 import json
+import time
+from itertools import islice
+from pathlib import Path
 
-from django.core.management import BaseCommand
+from api.versions import bump_version
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
 from recipes.models import Ingredient
 
+DEFAULT_PATH = Path(settings.BASE_DIR) / 'data' / 'ingredients.json'
+CHUNK_SIZE = 64 * 1024
+
+
+def read_json(file):
+    '''Потоковое чтение JSON-массива объектов без загрузки файла целиком'''
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), ''):
+        buffer += chunk
+        position = 0
+        while True:
+            while (position < len(buffer)
+                   and buffer[position] in ' \t\r\n,[]'):
+                started = started or buffer[position] == '['
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                raise CommandError('Ожидался JSON-массив')
+            try:
+                row, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield row['name'], row['measurement_unit']
+        buffer = buffer[position:]
+    if buffer.strip():
+        raise CommandError('Некорректный JSON в конце файла')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1]
+
+
+READERS = {
+    '.json': read_json,
+    '.csv': read_csv,
+}
+
 
 class Command(BaseCommand):
     '''
     Импорт данных модели Ingredient.
     Выполнить миграции.
-    Выполнить команду python manage.py import_db
+    Выполнить команду python manage.py import_db [путь к .json или .csv]
+    Повторный запуск не создаёт дублей.
     '''
 
-    help = 'Импорт данных из файла ingredients.json'
+    help = 'Импорт ингредиентов из файла ingredients.json или ingredients.csv'
 
-    def handle(self, *args, **kwargs):
-        with open('data/ingredients.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=str(DEFAULT_PATH))
+        parser.add_argument('--batch-size', type=int, default=1000)
 
-        for row in data:
-            account = Ingredient(
-                name=row['name'],
-                measurement_unit=row['measurement_unit']
-            )
-            account.save()
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .json и .csv')
+        started = time.perf_counter()
+        before = Ingredient.objects.count()
+        total = 0
+        with open(path, encoding='utf-8', newline='') as file:
+            rows = reader(file)
+            while True:
+                batch = [
+                    Ingredient(name=name.strip(),
+                               measurement_unit=unit.strip())
+                    for name, unit in islice(rows, options['batch_size'])
+                ]
+                if not batch:
+                    break
+                with transaction.atomic():
+                    Ingredient.objects.bulk_create(batch,
+                                                   ignore_conflicts=True)
+                total += len(batch)
+        created = Ingredient.objects.count() - before
+        bump_version('ingredients')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {total}, добавлено: {created}, '
+            f'пропущено: {total - created} за {elapsed:.3f} с '
+            f'({total / elapsed:.0f} строк/с)'))
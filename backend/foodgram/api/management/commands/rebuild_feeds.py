@@ -0,0 +1,17 @@
+from django.core.management import BaseCommand
+from recipes import feed
+from recipes.models import FeedEntry
+
+
+class Command(BaseCommand):
+    '''
+    Пересборка лент подписок по текущим подпискам.
+    Выполнить команду python manage.py rebuild_feeds
+    '''
+
+    help = 'Пересборка лент подписок'
+
+    def handle(self, *args, **options):
+        feed.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты пересобраны, записей: {FeedEntry.objects.count()}'))
@@ -0,0 +1,27 @@
+from django.core.management import BaseCommand, CommandError
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    '''
+    Пересборка и проверка сохранённых списков покупок.
+    Выполнить команду python manage.py rebuild_shopping_lists
+    '''
+
+    help = 'Пересборка списков покупок по корзинам пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только проверить, без пересборки')
+
+    def handle(self, *args, **options):
+        drift = shopping_list.verify()
+        self.stdout.write(f'Расхождений: {len(drift)}')
+        if options['check']:
+            if drift:
+                raise CommandError('Списки покупок рассогласованы')
+            return
+        shopping_list.rebuild()
+        if shopping_list.verify():
+            raise CommandError('Списки покупок рассогласованы после сборки')
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны'))
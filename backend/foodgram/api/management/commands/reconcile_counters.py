@@ -0,0 +1,29 @@
+from django.core.management import BaseCommand, CommandError
+from recipes import counters
+
+
+class Command(BaseCommand):
+    '''
+    Проверка и исправление счётчиков избранного, корзин,
+    рецептов и подписчиков.
+    Выполнить команду python manage.py reconcile_counters
+    '''
+
+    help = 'Пересчёт разошедшихся счётчиков популярности'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только проверить, без исправления')
+
+    def handle(self, *args, **options):
+        drift = counters.verify()
+        for counter, count in drift.items():
+            self.stdout.write(f'{counter}: расхождений {count}')
+        if options['check']:
+            if any(drift.values()):
+                raise CommandError('Счётчики рассогласованы')
+            return
+        fixed = counters.reconcile()
+        if any(counters.verify().values()):
+            raise CommandError('Счётчики рассогласованы после пересчёта')
+        self.stdout.write(self.style.SUCCESS(f'Исправлено строк: {fixed}'))
@@ -0,0 +1,18 @@
+from django.db import models
+
+
+class Version(models.Model):
+    '''Версия набора данных, общая для всех процессов'''
+
+    name = models.CharField(verbose_name='Набор данных',
+                            max_length=50,
+                            primary_key=True)
+    value = models.PositiveBigIntegerField(verbose_name='Версия',
+                                           default=1)
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
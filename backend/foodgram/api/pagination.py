@@ -1,5 +1,141 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
+    '''
+    Постраничная пагинация. С параметром cursor включается пагинация
+    по ключу из cursor_ordering вьюсета: страница выбирается условием
+    WHERE вместо OFFSET, а общее число строк считается только с count=1.
+    '''
+
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = getattr(view, 'cursor_ordering', None)
+        self.keyset = (self.ordering is not None
+                       and self.cursor_query_param in request.query_params)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        page_size = self.get_page_size(request)
+        self.model = queryset.model
+        reverse, position = self.decode_cursor(request, self.model)
+        self.count = (queryset.count() if request.query_params.get(
+            self.count_query_param) in ('1', 'true') else None)
+        ordering = self.ordering
+        if reverse:
+            ordering = [self.invert(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(ordering, position))
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+        has_next = has_more if not reverse else position is not None
+        has_previous = has_more if reverse else position is not None
+        self.next_position = (self.position(rows[-1])
+                              if rows and has_next else None)
+        self.previous_position = (self.position(rows[0])
+                                  if rows and has_previous else None)
+        return rows
+
+    async def apaginate_queryset(self, queryset, request):
+        '''
+        Постраничная пагинация для асинхронных представлений: число строк
+        и страница читаются асинхронным ORM. Курсор не поддерживается.
+        '''
+        self.keyset = False
+        self.request = request
+        paginator = self.django_paginator_class(
+            queryset, self.get_page_size(request))
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)))
+        self.page.object_list = [
+            row async for row in self.page.object_list]
+        return self.page.object_list
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'count': self.count,
+            'next': self.get_cursor_link(False, self.next_position),
+            'previous': self.get_cursor_link(True, self.previous_position),
+            'results': data,
+        })
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def after(ordering, position):
+        '''Строки, идущие после позиции при заданной сортировке'''
+        condition = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**{f'{name}__{lookup}': position[index]})
+            for previous, value in zip(ordering[:index], position):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        return condition
+
+    def position(self, obj):
+        names = [field.lstrip('-') for field in self.ordering]
+        if isinstance(obj, dict):
+            # Строка .values(): pk хранится под именем поля
+            pk = self.model._meta.pk.attname
+            return [obj[pk if name == 'pk' else name] for name in names]
+        return [getattr(obj, name) for name in names]
+
+    def decode_cursor(self, request, model):
+        '''Направление и позиция страницы; пустой курсор - первая страница'''
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return False, None
+        try:
+            reverse, values = json.loads(
+                base64.urlsafe_b64decode(cursor.encode()))
+            fields = [model._meta.pk if name == 'pk'
+                      else model._meta.get_field(name)
+                      for name in (field.lstrip('-')
+                                   for field in self.ordering)]
+            if len(values) != len(fields):
+                raise ValueError
+            return bool(reverse), [field.to_python(value) for field, value
+                                   in zip(fields, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_cursor_link(self, reverse, position):
+        if position is None:
+            return None
+        # isoformat() сохраняет микросекунды, иначе строки с одной
+        # миллисекундой пропускались бы на границе страниц
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value
+                  for value in position]
+        cursor = base64.urlsafe_b64encode(
+            json.dumps([reverse, values]).encode()).decode()
+        url = remove_query_param(self.request.build_absolute_uri(),
+                                 self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
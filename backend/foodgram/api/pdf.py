@@ -0,0 +1,336 @@
+import hashlib
+import re
+import struct
+import zlib
+from functools import lru_cache
+from pathlib import Path
+
+PAGE_SIZE = (595, 842)
+MARGIN = 40
+FONT_SIZE = 12
+LINE_HEIGHT = 18
+# Таблицы TrueType, которые нужны PDF для встроенного шрифта
+FONT_TABLES = (b'cvt ', b'fpgm', b'glyf', b'head', b'hhea', b'hmtx',
+               b'loca', b'maxp', b'prep')
+# Флаги компонентов составного глифа
+ARG_1_AND_2_ARE_WORDS = 0x0001
+WE_HAVE_A_SCALE = 0x0008
+MORE_COMPONENTS = 0x0020
+WE_HAVE_AN_X_AND_Y_SCALE = 0x0040
+WE_HAVE_A_TWO_BY_TWO = 0x0080
+# Записей в одном блоке beginbfchar карты ToUnicode
+TO_UNICODE_BLOCK = 100
+
+
+class FontError(Exception):
+    '''Шрифт для PDF не найден или не является шрифтом TrueType'''
+
+
+class TrueTypeFont:
+    '''
+    Шрифт TrueType: номера глифов символов по таблице cmap, ширины
+    и подмножество глифов для встраивания в PDF.
+    '''
+
+    def __init__(self, data, name='Font'):
+        try:
+            self.parse(data)
+        except (struct.error, KeyError, ValueError) as error:
+            raise FontError(f'Не удалось прочитать шрифт {name}') from error
+        self.name = re.sub(r'[^A-Za-z0-9-]', '', name) or 'Font'
+
+    def parse(self, data):
+        version, count = struct.unpack_from('>IH', data)
+        if version not in (0x00010000, 0x74727565):
+            raise ValueError('Не TrueType')
+        self.tables = {}
+        for index in range(count):
+            tag, _, offset, length = struct.unpack_from(
+                '>4sIII', data, 12 + 16 * index)
+            self.tables[tag] = data[offset:offset + length]
+        head = self.tables[b'head']
+        self.units = struct.unpack_from('>H', head, 18)[0]
+        self.bbox = struct.unpack_from('>4h', head, 36)
+        long_loca = struct.unpack_from('>h', head, 50)[0]
+        self.glyphs = struct.unpack_from('>H', self.tables[b'maxp'], 4)[0]
+        hhea = self.tables[b'hhea']
+        self.ascent, self.descent = struct.unpack_from('>hh', hhea, 4)
+        metrics = struct.unpack_from('>H', hhea, 34)[0]
+        advances = struct.unpack_from(f'>{2 * metrics}H',
+                                      self.tables[b'hmtx'])[::2]
+        self.advances = advances + advances[-1:] * (self.glyphs - metrics)
+        if long_loca:
+            self.loca = struct.unpack_from(f'>{self.glyphs + 1}I',
+                                           self.tables[b'loca'])
+        else:
+            self.loca = [offset * 2 for offset in struct.unpack_from(
+                f'>{self.glyphs + 1}H', self.tables[b'loca'])]
+        self.cmap = self.parse_cmap(self.tables[b'cmap'])
+
+    @staticmethod
+    def parse_cmap(cmap):
+        '''Символы базовой плоскости Unicode из подтаблицы формата 4'''
+        count = struct.unpack_from('>H', cmap, 2)[0]
+        for index in range(count):
+            platform, encoding, offset = struct.unpack_from(
+                '>HHI', cmap, 4 + 8 * index)
+            if ((platform, encoding) in ((3, 1), (0, 3))
+                    and struct.unpack_from('>H', cmap, offset)[0] == 4):
+                break
+        else:
+            raise ValueError('Нет таблицы cmap Unicode')
+        segments = struct.unpack_from('>H', cmap, offset + 6)[0] // 2
+        ends = struct.unpack_from(f'>{segments}H', cmap, offset + 14)
+        starts = struct.unpack_from(f'>{segments}H', cmap,
+                                    offset + 16 + 2 * segments)
+        deltas = struct.unpack_from(f'>{segments}h', cmap,
+                                    offset + 16 + 4 * segments)
+        range_offsets = offset + 16 + 6 * segments
+        glyphs = {}
+        for index, (start, end, delta) in enumerate(
+                zip(starts, ends, deltas)):
+            range_offset = struct.unpack_from(
+                '>H', cmap, range_offsets + 2 * index)[0]
+            for code in range(start, min(end, 0xFFFE) + 1):
+                if range_offset:
+                    gid = struct.unpack_from(
+                        '>H', cmap, range_offsets + 2 * index + range_offset
+                        + 2 * (code - start))[0]
+                    gid = (gid + delta) & 0xFFFF if gid else 0
+                else:
+                    gid = (code + delta) & 0xFFFF
+                if gid:
+                    glyphs[code] = gid
+        return glyphs
+
+    def glyph_id(self, char):
+        return self.cmap.get(ord(char), 0)
+
+    def width(self, gid):
+        '''Ширина глифа в тысячных долях кегля, как в PDF'''
+        return round(self.advances[gid] * 1000 / self.units)
+
+    def outline(self, gid):
+        return self.tables[b'glyf'][self.loca[gid]:self.loca[gid + 1]]
+
+    def components(self, gid):
+        '''Глифы, из которых собран составной глиф'''
+        outline = self.outline(gid)
+        if len(outline) < 10 or struct.unpack_from('>h', outline)[0] >= 0:
+            return
+        offset = 10
+        flags = MORE_COMPONENTS
+        while flags & MORE_COMPONENTS:
+            flags, component = struct.unpack_from('>HH', outline, offset)
+            yield component
+            offset += 8 if flags & ARG_1_AND_2_ARE_WORDS else 6
+            if flags & WE_HAVE_A_SCALE:
+                offset += 2
+            elif flags & WE_HAVE_AN_X_AND_Y_SCALE:
+                offset += 4
+            elif flags & WE_HAVE_A_TWO_BY_TWO:
+                offset += 8
+
+    def subset(self, gids):
+        '''
+        Файл шрифта, где контуры есть только у нужных глифов. Номера
+        глифов не меняются, поэтому текст ссылается на них напрямую.
+        '''
+        keep, pending = {0}, list(gids)
+        while pending:
+            gid = pending.pop()
+            if gid not in keep:
+                keep.add(gid)
+                pending.extend(self.components(gid))
+        glyf, loca = bytearray(), []
+        for gid in range(self.glyphs):
+            loca.append(len(glyf))
+            if gid in keep:
+                glyf += self.outline(gid)
+                glyf += bytes(-len(glyf) % 4)
+        loca.append(len(glyf))
+        head = bytearray(self.tables[b'head'])
+        head[8:12] = bytes(4)
+        head[50:52] = struct.pack('>h', 1)
+        tables = {
+            **{tag: self.tables[tag] for tag in FONT_TABLES
+               if tag in self.tables},
+            b'glyf': bytes(glyf),
+            b'head': bytes(head),
+            b'loca': struct.pack(f'>{len(loca)}I', *loca),
+        }
+        return build_font(tables)
+
+
+def checksum(data):
+    data += bytes(-len(data) % 4)
+    return sum(struct.unpack(f'>{len(data) // 4}I', data)) & 0xFFFFFFFF
+
+
+def build_font(tables):
+    '''Файл TrueType из таблиц, отсортированных по тегу'''
+    count = len(tables)
+    power = 1 << (count.bit_length() - 1)
+    header = struct.pack('>IHHHH', 0x00010000, count, power * 16,
+                         power.bit_length() - 1, (count - power) * 16)
+    offset = 12 + 16 * count
+    directory, body = [], []
+    for tag in sorted(tables):
+        data = tables[tag]
+        directory.append(struct.pack('>4sIII', tag, checksum(data),
+                                     offset, len(data)))
+        data += bytes(-len(data) % 4)
+        body.append(data)
+        offset += len(data)
+    return header + b''.join(directory) + b''.join(body)
+
+
+@lru_cache(maxsize=4)
+def load_font(path):
+    '''Шрифт читается и разбирается один раз на процесс'''
+    try:
+        data = Path(path).read_bytes()
+    except (OSError, TypeError) as error:
+        raise FontError(f'Шрифт {path} недоступен') from error
+    return TrueTypeFont(data, Path(path).stem)
+
+
+class PDFWriter:
+    '''
+    Потоковая запись текстового PDF: страница отдаётся клиенту, как
+    только набрана, шрифт встраивается в конце подмножеством глифов
+    из текста, таблица xref пишется последней. Отсутствующий шрифт
+    вызывает FontError в конструкторе, до начала ответа.
+    '''
+
+    def __init__(self, font_path=None):
+        self.font = load_font(font_path)
+        self.offset = 0
+        self.offsets = {}
+        self.pages = []
+        self.next_id = 3
+        self.font_ids = self.reserve(5)
+        self.used = {}
+
+    def write(self, data):
+        self.offset += len(data)
+        return data
+
+    def obj(self, obj_id, body, stream=None):
+        self.offsets[obj_id] = self.offset
+        data = b'%d 0 obj\n' % obj_id + body
+        if stream is not None:
+            data += b'\nstream\n' + stream + b'\nendstream'
+        return self.write(data + b'\nendobj\n')
+
+    def reserve(self, count):
+        first = self.next_id
+        self.next_id += count
+        return range(first, first + count)
+
+    def encode(self, line):
+        '''Строка в номерах глифов для шрифта с кодировкой Identity-H'''
+        gids = []
+        for char in line:
+            gid = self.font.glyph_id(char)
+            self.used.setdefault(gid, char)
+            gids.append(b'%04X' % gid)
+        return b''.join(gids)
+
+    def page(self, lines):
+        width, height = PAGE_SIZE
+        content_id, page_id = self.reserve(2)
+        self.pages.append(page_id)
+        content = zlib.compress(b'BT /F1 %d Tf %d TL %d %d Td\n' % (
+            FONT_SIZE, LINE_HEIGHT, MARGIN, height - MARGIN - FONT_SIZE)
+            + b''.join(b'<%s> Tj T*\n' % self.encode(line) for line in lines)
+            + b'ET')
+        yield self.obj(content_id, b'<< /Length %d /Filter /FlateDecode >>'
+                       % len(content), content)
+        yield self.obj(page_id, (
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+            b'/Resources << /Font << /F1 %d 0 R >> >> '
+            b'/Contents %d 0 R >>'
+            % (width, height, self.font_ids[0], content_id)))
+
+    def fonts(self):
+        '''Шрифт Type0 с подмножеством глифов, использованных в тексте'''
+        font = self.font
+        type0_id, cid_id, descriptor_id, file_id, unicode_id = self.font_ids
+        used = sorted(self.used)
+        tag = ''.join(chr(65 + byte % 26) for byte in hashlib.md5(
+            b'%r' % used).digest()[:6])
+        name = f'{tag}+{font.name}'.encode()
+        scale = 1000 / font.units
+        yield self.obj(type0_id, (
+            b'<< /Type /Font /Subtype /Type0 /BaseFont /%s '
+            b'/Encoding /Identity-H /DescendantFonts [%d 0 R] '
+            b'/ToUnicode %d 0 R >>' % (name, cid_id, unicode_id)))
+        widths = b' '.join(b'%d [%d]' % (gid, font.width(gid))
+                           for gid in used)
+        yield self.obj(cid_id, (
+            b'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /%s '
+            b'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) '
+            b'/Supplement 0 >> /FontDescriptor %d 0 R '
+            b'/CIDToGIDMap /Identity /W [%s] >>'
+            % (name, descriptor_id, widths)))
+        yield self.obj(descriptor_id, (
+            b'<< /Type /FontDescriptor /FontName /%s /Flags 32 '
+            b'/FontBBox [%s] /ItalicAngle 0 /Ascent %d /Descent %d '
+            b'/CapHeight %d /StemV 80 /FontFile2 %d 0 R >>' % (
+                name,
+                b' '.join(b'%d' % round(value * scale)
+                          for value in font.bbox),
+                round(font.ascent * scale), round(font.descent * scale),
+                round(font.ascent * scale), file_id)))
+        data = font.subset(used)
+        packed = zlib.compress(data)
+        yield self.obj(file_id, b'<< /Length %d /Length1 %d '
+                       b'/Filter /FlateDecode >>' % (len(packed), len(data)),
+                       packed)
+        cmap = zlib.compress(to_unicode(self.used))
+        yield self.obj(unicode_id, b'<< /Length %d /Filter /FlateDecode >>'
+                       % len(cmap), cmap)
+
+    def stream(self, lines):
+        '''Генератор байтов PDF из строк текста'''
+        per_page = (PAGE_SIZE[1] - 2 * MARGIN) // LINE_HEIGHT
+        yield self.write(b'%PDF-1.4\n')
+        yield self.obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        batch = []
+        for line in lines:
+            batch.append(line)
+            if len(batch) == per_page:
+                yield from self.page(batch)
+                batch = []
+        if batch or not self.pages:
+            yield from self.page(batch)
+        yield from self.fonts()
+        kids = b' '.join(b'%d 0 R' % page_id for page_id in self.pages)
+        yield self.obj(2, b'<< /Type /Pages /Kids [%s] /Count %d >>'
+                       % (kids, len(self.pages)))
+        xref = self.offset
+        size = self.next_id
+        entries = b''.join(b'%010d 00000 n \n' % self.offsets[obj_id]
+                           for obj_id in range(1, size))
+        yield self.write(
+            b'xref\n0 %d\n0000000000 65535 f \n' % size + entries
+            + b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+            % (size, xref))
+
+
+def to_unicode(chars):
+    '''Карта ToUnicode: по ней из PDF копируется и ищется текст'''
+    entries = [b'<%04X> <%s>' % (gid, char.encode('utf-16-be').hex().encode())
+               for gid, char in sorted(chars.items())]
+    blocks = b''.join(
+        b'%d beginbfchar\n%s\nendbfchar\n' % (
+            len(block), b'\n'.join(block))
+        for block in (entries[start:start + TO_UNICODE_BLOCK]
+                      for start in range(0, len(entries), TO_UNICODE_BLOCK)))
+    return (b'/CIDInit /ProcSet findresource begin\n12 dict begin\n'
+            b'begincmap\n/CIDSystemInfo << /Registry (Adobe) '
+            b'/Ordering (UCS) /Supplement 0 >> def\n/CMapName /Adobe-Identity-'
+            b'UCS def\n/CMapType 2 def\n1 begincodespacerange\n<0000> <FFFF>\n'
+            b'endcodespacerange\n' + blocks + b'endcmap\nCMapName currentdict '
+            b'/CMap defineresource pop\nend\nend')
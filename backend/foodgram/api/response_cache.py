@@ -0,0 +1,142 @@
+import hashlib
+import uuid
+
+from api.viewer import ViewerState, viewer_state
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+KEY = 'response:{}:{}'
+DEPENDENCY_KEY = 'response-dependency:{}'
+# Параметры списка, от которых зависит общий для всех ответ
+LIST_PARAMS = ('page', 'limit', 'tags', 'author')
+FLAGS = ('is_favorited', 'is_in_shopping_cart')
+# Список меняется при изменении любого рецепта, рецепт - только своём
+LIST_DEPENDENCIES = ('recipes', 'tags', 'ingredients')
+
+
+def invalidate(*names):
+    '''
+    Сбрасывает ответы, зависящие от названных данных. Метка - случайная
+    строка, а не счётчик: вытесненная из кеша метка не совпадёт
+    со старой и не оживит устаревшие ответы.
+    '''
+    cache.set_many({DEPENDENCY_KEY.format(name): uuid.uuid4().hex
+                    for name in names}, timeout=None)
+
+
+def dependency_tags(names):
+    keys = {DEPENDENCY_KEY.format(name): name for name in names}
+    found = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in found}
+    if missing:
+        for key, tag in missing.items():
+            cache.add(key, tag, timeout=None)
+        found.update(cache.get_many(missing))
+    return {keys[key]: tag for key, tag in found.items()}
+
+
+def list_key(request):
+    '''Ключ списка рецептов или None, если ответ нельзя делить'''
+    params = request.query_params
+    if any(name not in LIST_PARAMS for name in params):
+        return None
+    normalized = '&'.join((
+        f'page={params.get("page") or 1}',
+        f'limit={params.get("limit", "")}',
+        f'author={params.get("author", "")}',
+        'tags=' + ','.join(sorted(set(params.getlist('tags')))),
+    ))
+    return make_key(request, 'list', normalized)
+
+
+def detail_key(request, pk):
+    return make_key(request, 'detail', pk)
+
+
+def detail_dependencies(pk):
+    return ('tags', 'ingredients', f'recipe:{pk}')
+
+
+def make_key(request, kind, value):
+    # Ссылки пагинации абсолютные, поэтому ключ включает хост
+    digest = hashlib.md5(
+        f'{request.get_host()}{request.path}?{value}'.encode()).hexdigest()
+    return KEY.format(kind, digest)
+
+
+def get(request, key):
+    '''Закешированный ответ с флагами текущего пользователя'''
+    if key is None:
+        return None
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    data, tags = entry
+    if dependency_tags(tags) != tags:
+        return None
+    overlay(viewer_state(request), recipes(data))
+    return data
+
+
+def store(key, data, tags):
+    '''Сохраняет ответ без флагов пользователя'''
+    items = recipes(data)
+    tags = {**tags, **dependency_tags(
+        {f'user:{recipe["author"]["id"]}' for recipe in items})}
+    saved = [(recipe['author']['is_subscribed'],
+              *(recipe[flag] for flag in FLAGS)) for recipe in items]
+    overlay(ViewerState(None), items)
+    cache.set(key, (data, tags), timeout=settings.RESPONSE_CACHE_TIMEOUT)
+    for recipe, (is_subscribed, *flags) in zip(items, saved):
+        recipe['author']['is_subscribed'] = is_subscribed
+        recipe.update(zip(FLAGS, flags))
+
+
+def respond(request, key, names, view):
+    '''
+    Ответ из кеша или построенный view. Метки данных снимаются
+    до построения ответа: изменение во время сериализации сделает
+    сохранённый ответ устаревшим сразу. Метки авторов известны только
+    после сериализации.
+    '''
+    data = get(request, key)
+    if data is not None:
+        return Response(data)
+    if key is None:
+        return view()
+    tags = dependency_tags(names)
+    response = view()
+    if response.status_code == status.HTTP_200_OK:
+        store(key, response.data, tags)
+    return response
+
+
+async def arespond(request, key, names, view):
+    '''respond для асинхронных представлений, view - корутина'''
+    data = await sync_to_async(get)(request, key)
+    if data is not None:
+        return Response(data)
+    if key is None:
+        return await view()
+    tags = await sync_to_async(dependency_tags)(names)
+    response = await view()
+    if response.status_code == status.HTTP_200_OK:
+        await sync_to_async(store)(key, response.data, tags)
+    return response
+
+
+def recipes(data):
+    return data['results'] if 'results' in data else [data]
+
+
+def overlay(state, items):
+    '''Проставляет флаги избранного, корзины и подписки из ViewerState'''
+    for recipe in items:
+        recipe['is_favorited'] = state.is_favorited(recipe['id'])
+        recipe['is_in_shopping_cart'] = state.is_in_shopping_cart(
+            recipe['id'])
+        recipe['author']['is_subscribed'] = state.is_subscribed(
+            recipe['author']['id'])
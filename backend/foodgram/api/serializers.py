@@ -1,13 +1,16 @@
-from api.fields import Base64ImageField
+from api.fields import (Base64ImageField, BulkPrimaryKeyRelatedField,
+                        RenditionsField, same_content)
+from api.viewer import viewer_state
 from django.db.transaction import atomic
 from djoser.serializers import UserSerializer
-from recipes.models import (Favourite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from jobs.models import Job
+from recipes import shopping_list
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
 from rest_framework import serializers
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import ErrorDetail, ValidationError
 from rest_framework.fields import SerializerMethodField
 from rest_framework.serializers import ModelSerializer, PrimaryKeyRelatedField
-from users.models import Follow, User
+from users.models import User
 
 
 class MyUserSerializer(UserSerializer):
@@ -21,10 +24,8 @@ class MyUserSerializer(UserSerializer):
                   'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Follow.objects.filter(user=user, author=obj).exists()
+        return viewer_state(self.context.get('request')).is_subscribed(
+            obj.pk)
 
 
 class RecipeShowSerializer(ModelSerializer):
@@ -33,16 +34,17 @@ class RecipeShowSerializer(ModelSerializer):
     в подписках, избранном и покупках
     '''
 
+    renditions = RenditionsField(source='image')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'renditions', 'cooking_time')
 
 
 class FollowSerializer(MyUserSerializer):
     '''Сериализатор подписoк'''
 
-    recipes_count = serializers.IntegerField(source='recipes.count',
-                                             read_only=True)
+    recipes_count = serializers.IntegerField(read_only=True)
     recipes = RecipeShowSerializer(many=True, read_only=True)
     is_subscribed = serializers.BooleanField(default=True)
 
@@ -71,10 +73,30 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit')
 
 
+class IngredientAmountListSerializer(serializers.ListSerializer):
+    '''Ингредиенты рецепта проверяются одним запросом IN'''
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        ingredients = Ingredient.objects.in_bulk(
+            [item['id'] for item in items])
+        message = PrimaryKeyRelatedField.default_error_messages[
+            'does_not_exist']
+        errors = [{} if item['id'] in ingredients
+                  else {'id': [ErrorDetail(message.format(pk_value=item['id']),
+                                           code='does_not_exist')]}
+                  for item in items]
+        if any(errors):
+            raise ValidationError(errors)
+        for item in items:
+            item['id'] = ingredients[item['id']]
+        return items
+
+
 class IngredientRecipeCreationSerializer(ModelSerializer):
     '''Сериализатор для вывода ингредиента при создании рецепта'''
 
-    id = PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
         source='ingredient.measurement_unit')
@@ -82,6 +104,7 @@ class IngredientRecipeCreationSerializer(ModelSerializer):
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'amount', 'name', 'measurement_unit')
+        list_serializer_class = IngredientAmountListSerializer
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
@@ -97,6 +120,7 @@ class RecipeGetSerializer(ModelSerializer):
     ingredients = IngredientRecipeCreationSerializer(
         source='recipeingredient', many=True)
     image = Base64ImageField()
+    renditions = RenditionsField(source='image')
     is_favorited = SerializerMethodField(read_only=True)
     is_in_shopping_cart = SerializerMethodField(read_only=True)
 
@@ -104,26 +128,30 @@ class RecipeGetSerializer(ModelSerializer):
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart', 'name',
-                  'image', 'text', 'cooking_time')
+                  'image', 'renditions', 'text', 'cooking_time')
 
     def get_is_favorited(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return Favourite.objects.filter(user=user, recipe=obj).exists()
+        return viewer_state(self.context.get('request')).is_favorited(obj.pk)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return ShoppingCart.objects.filter(user=user, recipe=obj).exists()
+        return viewer_state(
+            self.context.get('request')).is_in_shopping_cart(obj.pk)
+
+
+class PantryRecipeSerializer(RecipeGetSerializer):
+    '''Рецепт с долей имеющихся ингредиентов'''
+
+    coverage = serializers.FloatField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeGetSerializer.Meta):
+        fields = RecipeGetSerializer.Meta.fields + ('coverage', 'missing')
 
 
 class RecipeCreateSerializer(ModelSerializer):
     '''Сериализатор создания рецепта'''
 
-    tags = serializers.PrimaryKeyRelatedField(queryset=Tag.objects.all(),
-                                              many=True)
+    tags = BulkPrimaryKeyRelatedField(queryset=Tag.objects.all(), many=True)
     author = MyUserSerializer(read_only=True)
     ingredients = IngredientRecipeCreationSerializer(many=True)
     image = Base64ImageField()
@@ -145,22 +173,21 @@ class RecipeCreateSerializer(ModelSerializer):
             raise ValidationError({
                 'ingredients': 'Добавьте хотя бы один ингредиент!'
             })
-        ingredients_list = []
-        for item in ingredients:
-            if item['id'] in ingredients_list:
-                raise ValidationError({
-                    'ingredients': 'Ингредиенты не должны дублироваться!'
-                })
-            if int(item['amount']) <= 0:
-                raise ValidationError({
-                    'amount': 'Количество должно быть больше нуля!'
-                })
-            ingredients_list.append(item['id'])
+        if len({item['id'] for item in ingredients}) != len(ingredients):
+            raise ValidationError({
+                'ingredients': 'Ингредиенты не должны дублироваться!'
+            })
+        if any(int(item['amount']) <= 0 for item in ingredients):
+            raise ValidationError({
+                'amount': 'Количество должно быть больше нуля!'
+            })
         return value
 
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
+        # Связи загружаются пачкой, а не запросом на каждый ингредиент
+        instance = Recipe.objects.for_read().get(pk=instance.pk)
         return RecipeGetSerializer(instance,
                                    context=context).data
 
@@ -181,11 +208,58 @@ class RecipeCreateSerializer(ModelSerializer):
         self.addon_for_create_update_methods(ingredients, tags, recipe)
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        '''
+        Изменяет только отличающиеся строки ингредиентов рецепта.
+        Возвращает прежние количества для пересчёта списков покупок.
+        '''
+        existing = {row.ingredient_id: row for row in
+                    RecipeIngredient.objects.filter(recipe=recipe)}
+        submitted = {item['id'].id: item['amount'] for item in ingredients}
+        old_amounts = {ingredient_id: row.amount
+                       for ingredient_id, row in existing.items()}
+        removed = [row.pk for ingredient_id, row in existing.items()
+                   if ingredient_id not in submitted]
+        changed = []
+        for ingredient_id, row in existing.items():
+            amount = submitted.get(ingredient_id)
+            if amount is not None and amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        added = [RecipeIngredient(recipe=recipe,
+                                  ingredient_id=ingredient_id,
+                                  amount=amount)
+                 for ingredient_id, amount in submitted.items()
+                 if ingredient_id not in existing]
+        if removed:
+            RecipeIngredient.objects.filter(pk__in=removed).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        if added:
+            RecipeIngredient.objects.bulk_create(added)
+        shopping_list.change_recipe(recipe.id, old_amounts, submitted)
+
     @atomic
     def update(self, recipe, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        recipe.tags.clear()
-        recipe.ingredients.clear()
-        self.addon_for_create_update_methods(ingredients, tags, recipe)
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        image = validated_data.get('image')
+        if image is not None and recipe.image and same_content(recipe.image,
+                                                               image):
+            # Тот же файл не перезаписывается, версии остаются прежними
+            del validated_data['image']
+        if tags is not None:
+            # set() удаляет и добавляет только изменившиеся связи
+            recipe.tags.set(tags)
+        if ingredients is not None:
+            self.update_ingredients(recipe, ingredients)
         return super().update(recipe, validated_data)
+
+
+class JobSerializer(serializers.ModelSerializer):
+    '''Сериализатор статуса фоновой задачи'''
+
+    class Meta:
+        model = Job
+        fields = ('id', 'task', 'status', 'attempts', 'result', 'created',
+                  'finished')
@@ -0,0 +1,89 @@
+from api import response_cache
+from api.authentication import token_cache
+from api.indexes import pantry_index
+from api.versions import bump_version
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from recipes.models import Ingredient, Recipe, Tag
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+# Поля, после изменения которых кешированный токен недействителен
+TOKEN_FIELDS = {'password', 'is_active'}
+# Поля автора в закешированных ответах с рецептами
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    bump_version('ingredients')
+    response_cache.invalidate('ingredients')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tags_changed(sender, **kwargs):
+    bump_version('tags')
+    response_cache.invalidate('tags')
+
+
+def recipe_changed(pk):
+    bump_version('recipes')
+    response_cache.invalidate('recipes', f'recipe:{pk}')
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    # Ингредиенты и теги рецепта сохраняются после него в той же транзакции
+    transaction.on_commit(lambda: recipe_changed(instance.pk))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    pantry_index.forget((instance.pk,))
+    pk = instance.pk
+    transaction.on_commit(lambda: recipe_changed(pk))
+
+
+def revoke_tokens(keys):
+    # После фиксации: до неё параллельный запрос ещё прочитает токен из БД
+    transaction.on_commit(lambda: token_cache.invalidate(keys))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    # Удаление пользователя удаляет и его токены, сигнал придёт сюда
+    revoke_tokens((instance.key,))
+
+
+def affects(fields, update_fields):
+    return update_fields is None or not fields.isdisjoint(update_fields)
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields, **kwargs):
+    # Значения до сохранения: смена пароля, блокировка или сохранение
+    # в админке без изменения имени не должны трогать рецепты автора
+    instance._author_before = None
+    if instance.pk is not None and affects(AUTHOR_FIELDS, update_fields):
+        instance._author_before = User.objects.filter(
+            pk=instance.pk).values(*AUTHOR_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    # Вход обновляет только last_login, кеши при этом не сбрасываются
+    if created:
+        return
+    if affects(TOKEN_FIELDS, update_fields):
+        revoke_tokens(list(Token.objects.filter(
+            user=instance).values_list('key', flat=True)))
+    before = instance._author_before
+    if before is not None and any(
+            getattr(instance, field) != value
+            for field, value in before.items()):
+        # Автор входит в ответ рецепта, а ETag и Last-Modified рецепта
+        # строятся по дате его изменения
+        Recipe.objects.filter(author=instance).update(updated=timezone.now())
+        response_cache.invalidate(f'user:{instance.pk}')
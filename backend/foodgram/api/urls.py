@@ -1,5 +1,7 @@
-from api.views import (IngredientViewSet, MyUserViewSet, RecipeViewSet,
-                       TagViewSet)
+from api import async_views
+from api.views import (IngredientViewSet, JobViewSet, MyUserViewSet,
+                       RecipeViewSet, TagViewSet, token_cache_stats)
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
@@ -7,11 +9,18 @@ app_name = 'api'
 
 router = DefaultRouter()
 router.register('ingredients', IngredientViewSet, basename='ingredients')
+router.register('jobs', JobViewSet, basename='jobs')
 router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('tags', TagViewSet, basename='tags')
 router.register('users', MyUserViewSet, basename='users')
 
-urlpatterns = [
+urlpatterns = []
+if settings.ASYNC_READ_VIEWS:
+    # Под ASGI GET этих маршрутов обслуживают корутины до роутера
+    urlpatterns += async_views.urls(router)
+urlpatterns += [
     path('', include(router.urls)),
+    path('auth/token/stats/', token_cache_stats,
+         name='token-cache-stats'),
     path('auth/', include('djoser.urls.authtoken')),
 ]
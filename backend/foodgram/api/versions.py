@@ -0,0 +1,55 @@
+from api.models import Version
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+KEY = 'version:{}'
+# Запись в общем кеше обновляется после фиксации транзакции; срок
+# ограничивает устаревание, если две фиксации записали кеш не по порядку
+CACHE_TIMEOUT = 60
+# Кеши, которые видны только текущему процессу
+LOCAL_CACHES = (
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+def shared_cache():
+    '''Кеш по умолчанию общий для процессов (Redis, Memcached, файлы, БД)'''
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHES
+
+
+def get_version(name):
+    '''
+    Текущая версия набора данных. Хранится в БД, чтобы её увеличение
+    в import_db, воркере задач или другом воркере сервера видели все
+    процессы; общий кеш лишь избавляет от запроса на каждое чтение.
+    '''
+    key = KEY.format(name)
+    if shared_cache():
+        version = cache.get(key)
+        if version is not None:
+            return version
+    version = Version.objects.filter(name=name).values_list(
+        'value', flat=True).first() or 1
+    if shared_cache():
+        # add не перезапишет версию, сохранённую после фиксации
+        cache.add(key, version, timeout=CACHE_TIMEOUT)
+    return version
+
+
+def bump_version(name):
+    '''Увеличивает версию набора данных после его изменения'''
+    # Один запрос: строка создаётся при первом увеличении, параллельные
+    # увеличения упорядочивает блокировка строки
+    table = Version._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (name, value) VALUES (%s, 2) '
+            f'ON CONFLICT (name) DO UPDATE SET value = {table}.value + 1 '
+            f'RETURNING value', [name])
+        version = cursor.fetchone()[0]
+    if shared_cache():
+        transaction.on_commit(lambda: cache.set(
+            KEY.format(name), version, timeout=CACHE_TIMEOUT))
+    return version
@@ -0,0 +1,64 @@
+from django.db.models import CharField, Value
+from django.utils.functional import cached_property
+from recipes.models import Favourite, ShoppingCart
+from users.models import Follow
+
+
+class ViewerState:
+    '''
+    Подписки, избранное и корзина текущего пользователя.
+    Загружаются одним запросом при первом обращении, дальше флаги
+    сериализаторов - проверки по множествам.
+    '''
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def relations(self):
+        return self.collect(() if self.anonymous else self.rows())
+
+    async def aload(self):
+        '''Загрузка асинхронным ORM до первого обращения к флагам'''
+        if 'relations' not in self.__dict__:
+            self.relations = self.collect(
+                () if self.anonymous else [row async for row in self.rows()])
+
+    @property
+    def anonymous(self):
+        return self.user is None or self.user.is_anonymous
+
+    def rows(self):
+        return Follow.objects.filter(user=self.user).order_by().values_list(
+            'author_id', Value('follow', CharField())
+        ).union(
+            Favourite.objects.filter(user=self.user).values_list(
+                'recipe_id', Value('favourite', CharField())),
+            ShoppingCart.objects.filter(user=self.user).values_list(
+                'recipe_id', Value('cart', CharField())),
+            all=True)
+
+    @staticmethod
+    def collect(rows):
+        found = {'follow': set(), 'favourite': set(), 'cart': set()}
+        for pk, kind in rows:
+            found[kind].add(pk)
+        return found
+
+    def is_subscribed(self, author_id):
+        return author_id in self.relations['follow']
+
+    def is_favorited(self, recipe_id):
+        return recipe_id in self.relations['favourite']
+
+    def is_in_shopping_cart(self, recipe_id):
+        return recipe_id in self.relations['cart']
+
+
+def viewer_state(request):
+    '''Состояние текущего пользователя, одно на запрос'''
+    if request is None:
+        return ViewerState(None)
+    if not hasattr(request, 'viewer_state'):
+        request.viewer_state = ViewerState(request.user)
+    return request.viewer_state
@@ -1,25 +1,42 @@
+from functools import partial
+
+from api import response_cache
+from api.authentication import token_cache
+from api.conditional import recipe_detail, reference_data
+from api.exports import EXPORTS, FILE, aiterate
+from api.fast_serializers import FastRecipeSerializer
 from api.filters import NameSearchFilter, RecipeFilter
+from api.indexes import ingredient_index, pantry_index
 from api.pagination import CustomPagination
+from api.pdf import FontError
 from api.permissions import IsAdminOrReadOnly, IsAuthorOrReadOnly
+from api.renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
 from api.serializers import (FollowSerializer, IngredientSerializer,
-                             MyUserSerializer, RecipeCreateSerializer,
-                             RecipeGetSerializer, RecipeIngredient,
-                             RecipeShowSerializer, TagSerializer)
-from django.db.models.aggregates import Sum
-from django.http import HttpResponse
+                             JobSerializer, MyUserSerializer,
+                             PantryRecipeSerializer, RecipeCreateSerializer,
+                             RecipeGetSerializer, RecipeShowSerializer,
+                             TagSerializer)
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.decorators import method_decorator
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from recipes.models import Favourite, Ingredient, Recipe, ShoppingCart, Tag
+from jobs.models import Job
+from jobs.queue import enqueue
+from recipes.models import (Favourite, FeedEntry, Ingredient, Recipe,
+                            ShoppingCart, Tag)
 from rest_framework import status, viewsets
-from rest_framework.decorators import action
-from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import (SAFE_METHODS, IsAdminUser,
+                                        IsAuthenticated)
 from rest_framework.response import Response
 from users.models import Follow, User
 
-SHOP_LIST = 'Список покупок:'
-FILE = 'shopping_list.txt'
-
 
 class MyUserViewSet(UserViewSet):
     '''Вьюсет для пользователей и подписок'''
@@ -28,26 +45,75 @@ class MyUserViewSet(UserViewSet):
     serializer_class = MyUserSerializer
     pagination_class = CustomPagination
 
+    @property
+    def cursor_ordering(self):
+        if self.action == 'feed':
+            return ('-date', '-recipe_id')
+        return ('pk',)
+
+    def preview_recipes(self):
+        '''
+        Превью рецептов авторов, ограниченное параметром recipes_limit
+        на стороне БД.
+        '''
+        recipes = Recipe.objects.all()
+        limit = self.request.query_params.get('recipes_limit')
+        if limit is None or not limit.isdigit():
+            return recipes
+        return recipes.annotate(row_number=Window(
+            RowNumber(),
+            partition_by=F('author'),
+            order_by=(F('date').desc(), F('pk').desc()),
+        )).filter(row_number__lte=int(limit))
+
+    def following(self):
+        return User.objects.filter(
+            following__user=self.request.user).order_by('pk')
+
+    def with_recipes(self, queryset):
+        '''Число рецептов авторов хранится в User.recipes_count'''
+        return queryset.prefetch_related(
+            Prefetch('recipes', queryset=self.preview_recipes()))
+
     @action(detail=False,
             methods=['GET'],
             permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
-        user = request.user
-        queryset = User.objects.filter(following__user=user)
+        queryset = self.with_recipes(self.following())
         page = self.paginate_queryset(queryset)
         serializer = FollowSerializer(page,
                                       many=True,
                                       context={'request': request})
         return self.get_paginated_response(serializer.data)
 
+    @action(detail=False,
+            methods=['GET'],
+            permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        '''
+        Лента рецептов авторов из подписок. Страница - диапазон индекса
+        (user, -date, -recipe), рецепты загружаются вторым запросом.
+        '''
+        entries = FeedEntry.objects.filter(user=request.user).only(
+            'recipe', 'date').order_by('-date', '-recipe_id')
+        page = self.paginate_queryset(entries)
+        recipes = Recipe.objects.for_read().in_bulk(
+            [entry.recipe_id for entry in page])
+        serializer = RecipeGetSerializer(
+            [recipes[entry.recipe_id] for entry in page
+             if entry.recipe_id in recipes],
+            many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
     @action(detail=True,
             methods=['POST', 'DELETE'],
             permission_classes=[IsAuthenticated])
     def subscribe(self, request, id):
         user = request.user
-        author = get_object_or_404(User, id=id)
 
         if request.method == 'POST':
+            author = get_object_or_404(self.with_recipes(User.objects.all()),
+                                       id=id)
             if user.id == author.id:
                 return Response({'detail': 'Нельзя подписаться на себя!'},
                                 status=status.HTTP_400_BAD_REQUEST)
@@ -59,6 +125,7 @@ class MyUserViewSet(UserViewSet):
                                           context={'request': request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+        author = get_object_or_404(User, id=id)
         if not Follow.objects.filter(user=user, author=author).exists():
             return Response({'errors': 'Сначала нужно подписаться!'},
                             status=status.HTTP_400_BAD_REQUEST)
@@ -67,6 +134,8 @@ class MyUserViewSet(UserViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+@method_decorator(reference_data('ingredients'), name='list')
+@method_decorator(reference_data('ingredients'), name='retrieve')
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     '''Вьюсет ингредиентов'''
 
@@ -77,7 +146,15 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ('^name',)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get(NameSearchFilter.search_param)
+        if name:
+            return HttpResponse(ingredient_index.search_json(name),
+                                content_type='application/json')
+        return super().list(request, *args, **kwargs)
+
 
+@method_decorator(recipe_detail, name='retrieve')
 class RecipeViewSet(viewsets.ModelViewSet):
     '''Вьюсет рецептов'''
 
@@ -90,11 +167,49 @@ class RecipeViewSet(viewsets.ModelViewSet):
         m for m in viewsets.ModelViewSet.http_method_names if m not in ['PUT']
     ]
 
+    @property
+    def cursor_ordering(self):
+        # Результаты поиска упорядочены по релевантности, а не по дате
+        params = self.request.query_params
+        if self.action == 'pantry' or params.get('search'):
+            return None
+        if params.get('ordering') == RecipeFilter.POPULAR:
+            return RecipeFilter.POPULAR_ORDERING
+        return ('-date', '-pk')
+
+    @property
+    def fast_read(self):
+        # Список и рецепт читаются из строк .values() без ModelSerializer
+        return (settings.FAST_READ_SERIALIZERS
+                and self.action in ('list', 'retrieve'))
+
+    def get_queryset(self):
+        if self.fast_read:
+            return FastRecipeSerializer.queryset()
+        if self.request.method in SAFE_METHODS:
+            return Recipe.objects.for_read()
+        return super().get_queryset()
+
     def get_serializer_class(self):
+        if self.fast_read:
+            return FastRecipeSerializer
         if self.request.method in SAFE_METHODS:
             return RecipeGetSerializer
         return RecipeCreateSerializer
 
+    def list(self, request, *args, **kwargs):
+        return response_cache.respond(
+            request, response_cache.list_key(request),
+            response_cache.LIST_DEPENDENCIES,
+            partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs['pk']
+        return response_cache.respond(
+            request, response_cache.detail_key(request, pk),
+            response_cache.detail_dependencies(pk),
+            partial(super().retrieve, request, *args, **kwargs))
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -131,30 +246,80 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return Response({'errors': 'Рецепта нет в списке'},
                         status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['GET'])
+    def pantry(self, request):
+        '''Рецепты по доле ингредиентов, которые уже есть у пользователя'''
+        try:
+            ingredient_ids = [
+                int(value)
+                for values in request.query_params.getlist('ingredients')
+                for value in values.split(',') if value]
+            min_coverage = float(request.query_params.get('min_coverage', 0))
+        except ValueError:
+            return Response({'errors': 'Некорректные параметры'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= min_coverage <= 1:
+            return Response({'errors': 'min_coverage должен быть от 0 до 1'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        page = self.paginate_queryset(
+            pantry_index.search(ingredient_ids, min_coverage))
+        recipes = Recipe.objects.for_read().in_bulk(
+            [recipe_id for recipe_id, _, _ in page])
+        pantry_index.forget(recipe_id for recipe_id, _, _ in page
+                            if recipe_id not in recipes)
+        results = []
+        for recipe_id, coverage, missing in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.coverage = round(coverage, 4)
+                recipe.missing = missing
+                results.append(recipe)
+        serializer = PantryRecipeSerializer(
+            results, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
     @action(detail=False,
             methods=['GET'],
-            permission_classes=[IsAuthenticated])
+            permission_classes=[IsAuthenticated],
+            renderer_classes=(PlainTextRenderer, CSVRenderer, PDFRenderer))
     def download_shopping_cart(self, request):
-        ingredients = (
-            RecipeIngredient.objects.filter(
-                recipe__shopping_cart__user=request.user)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .order_by('ingredient__name')
-            .annotate(amount=Sum('amount'))
-        )
-        result = SHOP_LIST
-        result += '\n'.join(
-            (
-                f'{ingredient["ingredient__name"]} - {ingredient["amount"]}/'
-                f'{ingredient["ingredient__measurement_unit"]}'
-                for ingredient in ingredients
-            )
-        )
-        response = HttpResponse(result, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename={FILE}'
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.format != 'pdf':
+            content_type += f'; charset={renderer.charset}'
+        try:
+            content = EXPORTS[renderer.format](request.user)
+        except FontError:
+            # Ответ ещё не начат: вместо оборванного PDF - ошибка текстом
+            return Response({'errors': 'Шрифт для PDF недоступен'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            content_type='text/plain; charset=utf-8')
+        if isinstance(request._request, ASGIRequest):
+            content = aiterate(content)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename={FILE.format(renderer.format)}')
         return response
 
+    @action(detail=False,
+            methods=['POST'],
+            permission_classes=[IsAuthenticated])
+    def export_shopping_cart(self, request):
+        '''Выгрузка списка покупок в фоне, адрес файла - в статусе задачи'''
+        fmt = request.data.get('format', 'txt')
+        if fmt not in EXPORTS:
+            return Response({'errors': 'Неизвестный формат'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        job = enqueue('api.exports.save_export', request.user.id, fmt,
+                      user=request.user)
+        return Response(JobSerializer(job).data,
+                        status=status.HTTP_202_ACCEPTED,
+                        headers={'Location': reverse('api:jobs-detail',
+                                                     args=(job.pk,))})
+
 
+@method_decorator(reference_data('tags'), name='list')
+@method_decorator(reference_data('tags'), name='retrieve')
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     '''Вьюсет тегов'''
 
@@ -162,3 +327,21 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     permission_classes = (IsAdminOrReadOnly,)
     pagination_class = None
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    '''Вьюсет статусов фоновых задач пользователя'''
+
+    serializer_class = JobSerializer
+    permission_classes = (IsAuthenticated,)
+    pagination_class = CustomPagination
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def token_cache_stats(request):
+    '''Статистика кеша токенов текущего процесса'''
+    return Response(token_cache.stats())
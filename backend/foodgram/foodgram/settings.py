@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     'recipes.apps.RecipesConfig',
     'users.apps.UsersConfig',
     'api.apps.ApiConfig',
+    'jobs.apps.JobsConfig',
 ]
 
 MIDDLEWARE = [
@@ -93,6 +94,15 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -145,7 +155,11 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.CustomPagination',
     'PAGE_SIZE': 6,
@@ -166,3 +180,43 @@ DJOSER = {
     },
     'HIDE_USERS': False,
 }
+
+INGREDIENTS_SEARCH_LIMIT = int(os.getenv('INGREDIENTS_SEARCH_LIMIT', 50))
+
+FEED_SYNC_FAN_OUT = int(os.getenv('FEED_SYNC_FAN_OUT', 200))
+
+FEED_BACKFILL = int(os.getenv('FEED_BACKFILL', 100))
+
+PANTRY_RESULTS_LIMIT = int(os.getenv('PANTRY_RESULTS_LIMIT', 500))
+
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', default='russian')
+
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10000))
+
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 300))
+
+AUTH_TOKEN_CACHE_SHARED = (
+    os.getenv('AUTH_TOKEN_CACHE_SHARED', 'False') == 'True')
+
+FAST_READ_SERIALIZERS = (
+    os.getenv('FAST_READ_SERIALIZERS', 'True') == 'True')
+
+ASYNC_READ_VIEWS = (os.getenv('ASYNC_READ_VIEWS', 'False') == 'True')
+
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
+REFERENCE_CACHE_MAX_AGE = int(os.getenv('REFERENCE_CACHE_MAX_AGE', 86400))
+
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+JOBS_EAGER = (os.getenv('JOBS_EAGER', 'False') == 'True')
+
+JOBS_PROCESSES = int(os.getenv('JOBS_PROCESSES', 2))
+
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', 1))
+
+JOBS_VISIBILITY_TIMEOUT = int(os.getenv('JOBS_VISIBILITY_TIMEOUT', 300))
+
+JOBS_RETRY_DELAY = int(os.getenv('JOBS_RETRY_DELAY', 10))
@@ -0,0 +1,11 @@
+from django.contrib import admin
+from jobs.models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'task', 'status', 'attempts', 'user',
+                    'created', 'finished')
+    list_filter = ('status',)
+    search_fields = ('task',)
+    raw_id_fields = ('user',)
@@ -0,0 +1,80 @@
+import logging
+import signal
+import time
+from multiprocessing import Process
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import DatabaseError, close_old_connections, connections
+from jobs.queue import run_next
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    '''Цикл обработки очереди в отдельном процессе'''
+
+    def __init__(self, poll_interval, burst):
+        self.poll_interval = poll_interval
+        self.burst = burst
+        self.stopping = False
+
+    def stop(self, *args):
+        # Текущая задача дорабатывает, новые не забираются
+        self.stopping = True
+
+    def __call__(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        while not self.stopping:
+            close_old_connections()
+            try:
+                if run_next():
+                    continue
+            except DatabaseError:
+                # Недоступная или занятая БД не должна останавливать воркер
+                logger.exception('Ошибка доступа к очереди задач')
+            else:
+                if self.burst:
+                    break
+            time.sleep(self.poll_interval)
+
+
+class Command(BaseCommand):
+    '''
+    Воркер фоновых задач.
+    Выполнить команду python manage.py run_jobs --processes 4
+    '''
+
+    help = 'Выполнение задач из очереди в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            default=settings.JOBS_PROCESSES)
+        parser.add_argument('--poll-interval', type=float,
+                            default=settings.JOBS_POLL_INTERVAL,
+                            help='Пауза при пустой очереди, с')
+        parser.add_argument('--burst', action='store_true',
+                            help='Завершиться, когда очередь опустеет')
+
+    def handle(self, *args, **options):
+        worker = Worker(options['poll_interval'], options['burst'])
+        if options['processes'] <= 1:
+            worker()
+            return
+        # Дочерние процессы открывают собственные соединения с БД
+        connections.close_all()
+        processes = [Process(target=worker, daemon=True)
+                     for _ in range(options['processes'])]
+        for process in processes:
+            process.start()
+
+        def stop(*args):
+            for process in processes:
+                process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        self.stdout.write(f'Запущено процессов: {len(processes)}')
+        for process in processes:
+            process.join()
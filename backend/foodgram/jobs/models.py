@@ -0,0 +1,66 @@
+from django.db import models
+from django.utils import timezone
+from users.models import User
+
+
+class Job(models.Model):
+    '''Модель фоновой задачи'''
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    task = models.CharField(verbose_name='Задача',
+                            max_length=200)
+    args = models.JSONField(verbose_name='Аргументы',
+                            default=list)
+    kwargs = models.JSONField(verbose_name='Именованные аргументы',
+                              default=dict)
+    status = models.CharField(verbose_name='Статус',
+                              max_length=20,
+                              choices=STATUSES,
+                              default=PENDING)
+    attempts = models.PositiveSmallIntegerField(verbose_name='Попыток',
+                                                default=0)
+    max_attempts = models.PositiveSmallIntegerField(
+        verbose_name='Максимум попыток', default=3)
+    run_at = models.DateTimeField(verbose_name='Запустить после',
+                                  default=timezone.now)
+    locked_until = models.DateTimeField(verbose_name='Заблокирована до',
+                                        null=True,
+                                        blank=True)
+    result = models.JSONField(verbose_name='Результат',
+                              null=True,
+                              blank=True)
+    error = models.TextField(verbose_name='Ошибка',
+                             blank=True)
+    user = models.ForeignKey(User,
+                             verbose_name='Пользователь',
+                             on_delete=models.SET_NULL,
+                             null=True,
+                             blank=True,
+                             related_name='jobs')
+    created = models.DateTimeField(verbose_name='Создана',
+                                   auto_now_add=True)
+    finished = models.DateTimeField(verbose_name='Завершена',
+                                    null=True,
+                                    blank=True)
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ('-pk',)
+        indexes = (
+            models.Index(fields=('status', 'run_at'),
+                         name='job_queue'),
+        )
+
+    def __str__(self):
+        return f'{self.task} ({self.get_status_display()})'
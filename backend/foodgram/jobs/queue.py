@@ -0,0 +1,100 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from jobs.models import Job
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(task, *args, user=None, max_attempts=3, **kwargs):
+    '''
+    Ставит задачу в очередь. task - путь к функции,
+    аргументы должны сериализоваться в JSON.
+    '''
+    job = Job.objects.create(task=task, args=list(args), kwargs=kwargs,
+                             user=user, max_attempts=max_attempts)
+    if settings.JOBS_EAGER:
+        transaction.on_commit(lambda: run(claim(job.pk)))
+    return job
+
+
+def claim(pk=None):
+    '''
+    Забирает задачу из очереди. Задача, не завершённая за время
+    видимости (упавший воркер), снова становится доступной.
+    '''
+    now = timezone.now()
+    queryset = Job.objects.filter(
+        Q(status=Job.PENDING, run_at__lte=now)
+        | Q(status=Job.RUNNING, locked_until__lt=now))
+    if pk is not None:
+        queryset = queryset.filter(pk=pk)
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        job = queryset.order_by('run_at', 'pk').first()
+        if job is None:
+            return None
+        # Условное обновление защищает от гонки там,
+        # где нет SELECT ... SKIP LOCKED (SQLite)
+        claimed = Job.objects.filter(
+            pk=job.pk, status=job.status, locked_until=job.locked_until,
+        ).update(
+            status=Job.RUNNING,
+            attempts=F('attempts') + 1,
+            locked_until=now + timedelta(
+                seconds=settings.JOBS_VISIBILITY_TIMEOUT),
+        )
+    if not claimed:
+        return None
+    job.refresh_from_db()
+    return job
+
+
+def run(job):
+    '''Выполняет задачу и сохраняет результат или планирует повтор'''
+    if job is None:
+        return
+    if job.attempts > job.max_attempts:
+        # Воркер, забравший задачу последним, не завершил её вовремя
+        job.status = Job.FAILED
+        job.error = job.error or 'Превышено время выполнения'
+        job.locked_until = None
+        job.finished = timezone.now()
+        job.save(update_fields=('status', 'error', 'locked_until',
+                                'finished'))
+        return
+    try:
+        result = import_string(job.task)(*job.args, **job.kwargs)
+    except Exception:
+        logger.exception('Задача %s завершилась с ошибкой', job.pk)
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.PENDING
+            job.run_at = timezone.now() + timedelta(
+                seconds=settings.JOBS_RETRY_DELAY * 2 ** (job.attempts - 1))
+        else:
+            job.status = Job.FAILED
+            job.finished = timezone.now()
+        job.locked_until = None
+        job.save(update_fields=('status', 'error', 'run_at',
+                                'locked_until', 'finished'))
+        return
+    job.status = Job.DONE
+    job.result = result
+    job.locked_until = None
+    job.finished = timezone.now()
+    job.save(update_fields=('status', 'result', 'locked_until', 'finished'))
+
+
+def run_next():
+    '''Выполняет одну задачу из очереди, False если очередь пуста'''
+    job = claim()
+    run(job)
+    return job is not None
@@ -1,40 +1,122 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from recipes import shopping_list
 from recipes.models import (Favourite, Ingredient, Recipe, RecipeIngredient,
                             ShoppingCart, Tag)
 
 
+class LoadedAutocompleteSelect(AutocompleteSelect):
+    '''
+    Автокомплит, берущий подпись выбранного значения из уже загруженного
+    объекта строки, а не отдельным запросом на каждую строку inline.
+    '''
+
+    selected = None
+
+    def optgroups(self, name, value, attr=None):
+        selected = self.selected
+        if selected is None or [str(v) for v in value] != [str(selected.pk)]:
+            return super().optgroups(name, value, attr)
+        label = self.choices.field.label_from_instance(selected)
+        return [(None, [self.create_option(name, selected.pk, label,
+                                           True, 0)], 0)]
+
+
+class RecipeIngredientForm(forms.ModelForm):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.ingredient_id is not None:
+            widget = self.fields['ingredient'].widget
+            getattr(widget, 'widget', widget).selected = (
+                self.instance.ingredient)
+
+
+class RecipeIngredientInline(admin.TabularInline):
+    model = RecipeIngredient
+    form = RecipeIngredientForm
+    autocomplete_fields = ('ingredient',)
+    extra = 0
+    min_num = 1
+
+    def get_queryset(self, request):
+        # Подпись строки inline - str(), в нём рецепт и ингредиент
+        return super().get_queryset(request).select_related('recipe',
+                                                            'ingredient')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.autocomplete_fields:
+            kwargs['widget'] = LoadedAutocompleteSelect(
+                db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
 @admin.register(Favourite)
 class FavouriteAdmin(admin.ModelAdmin):
-    list_display = ('user', 'recipe',)
-    search_fields = ('user', 'recipe',)
+    list_display = ('pk', 'user', 'recipe',)
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'user__email', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
 
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('pk', 'name', 'measurement_unit')
     search_fields = ('name', 'measurement_unit')
-    list_filter = ('name', 'measurement_unit')
+    list_filter = ('measurement_unit',)
 
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'name', 'author', 'text',
-                    'cooking_time', 'image', 'date')
-    search_fields = ('name', 'author', 'text', 'cooking_time')
-    list_filter = ('name', 'author', 'tags')
+    list_display = ('pk', 'name', 'author', 'cooking_time', 'image', 'date',
+                    'favourites_count', 'shopping_cart_count')
+    list_select_related = ('author',)
+    search_fields = ('name', 'author__username', 'author__email')
+    list_filter = ('tags',)
+    autocomplete_fields = ('author',)
+    readonly_fields = ('favourites_count', 'shopping_cart_count')
+    inlines = (RecipeIngredientInline,)
+    show_full_result_count = False
+
+    def save_related(self, request, form, formsets, change):
+        # Ингредиенты из inline меняют списки покупок корзин с рецептом
+        with shopping_list.changing((form.instance.pk,) if change else ()):
+            super().save_related(request, form, formsets, change)
 
 
 @admin.register(RecipeIngredient)
 class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ('pk', 'recipe', 'ingredient', 'amount')
-    search_fields = ('recipe', 'ingredient')
-    list_filter = ('recipe', 'ingredient')
+    list_select_related = ('recipe', 'ingredient')
+    search_fields = ('recipe__name', 'ingredient__name')
+    autocomplete_fields = ('recipe', 'ingredient')
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        # Строку могли перенести в другой рецепт, тогда меняются оба
+        recipe_ids = {obj.recipe_id, form.initial.get('recipe')} - {None}
+        with shopping_list.changing(recipe_ids):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with shopping_list.changing((obj.recipe_id,)):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        with shopping_list.changing(recipe_ids):
+            super().delete_queryset(request, queryset)
 
 
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'recipe',)
-    search_fields = ('user', 'recipe',)
+    list_display = ('pk', 'user', 'recipe',)
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'user__email', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
 
 
 @admin.register(Tag)
@@ -0,0 +1,59 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favourite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+# Счётчик, связанная модель и её поле, ссылающееся на объект со счётчиком
+COUNTERS = (
+    (Recipe, 'favourites_count', Favourite, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def change(model, pk, field, delta, origin=None):
+    '''
+    Атомарно меняет счётчик одним UPDATE без чтения строки.
+    Счётчик удаляемого объекта не трогается, а уменьшение
+    не опускает его ниже нуля.
+    '''
+    if isinstance(origin, model) and origin.pk == pk:
+        return
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def actual(related, field):
+    '''Число связанных строк подзапросом для каждого объекта'''
+    return Coalesce(Subquery(
+        related.objects.filter(**{field: OuterRef('pk')})
+        .order_by().values(field)
+        .annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def drifted(model, field, related, related_field):
+    return model.objects.annotate(
+        actual=actual(related, related_field)).exclude(
+            **{field: F('actual')})
+
+
+def verify():
+    '''Число объектов с расхождением для каждого счётчика'''
+    return {f'{model._meta.label}.{field}': drifted(
+        model, field, related, related_field).count()
+        for model, field, related, related_field in COUNTERS}
+
+
+@transaction.atomic
+def reconcile():
+    '''Пересчитывает разошедшиеся счётчики, по UPDATE на счётчик'''
+    return sum(
+        model.objects.filter(pk__in=drifted(
+            model, field, related, related_field).values('pk')
+        ).update(**{field: actual(related, related_field)})
+        for model, field, related, related_field in COUNTERS)
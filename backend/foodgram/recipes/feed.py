@@ -0,0 +1,91 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from jobs.queue import enqueue
+from recipes.models import FeedEntry, Recipe
+from users.models import Follow
+
+BATCH_SIZE = 1000
+
+
+def insert(entries):
+    '''Пакетная вставка, повторная запись в ленту не создаёт дублей'''
+    FeedEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE,
+                                  ignore_conflicts=True)
+
+
+def publish(recipe):
+    '''
+    Добавляет новый рецепт в ленты подписчиков автора.
+    Для авторов с большим числом подписчиков работа уходит воркеру.
+    '''
+    limit = settings.FEED_SYNC_FAN_OUT
+    user_ids = list(Follow.objects.filter(
+        author_id=recipe.author_id).values_list('user_id', flat=True)[
+            :limit + 1])
+    if len(user_ids) > limit:
+        enqueue('recipes.feed.fan_out', recipe.pk)
+        return
+    insert(FeedEntry(user_id=user_id, recipe_id=recipe.pk,
+                     author_id=recipe.author_id, date=recipe.date)
+           for user_id in user_ids)
+
+
+def fan_out(recipe_id):
+    '''Фоновая рассылка рецепта по лентам, транзакция на пакет'''
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'author_id', 'date').first()
+    if recipe is None:
+        return 0
+    user_ids = Follow.objects.filter(
+        author_id=recipe['author_id']).values_list('user_id', flat=True)
+    count = 0
+    batch = []
+    for user_id in user_ids.iterator(chunk_size=BATCH_SIZE):
+        batch.append(FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                               **recipe))
+        if len(batch) >= BATCH_SIZE:
+            with transaction.atomic():
+                insert(batch)
+            count += len(batch)
+            batch = []
+    insert(batch)
+    return count + len(batch)
+
+
+def backfill(user_id, author_id):
+    '''Последние рецепты автора в ленту нового подписчика'''
+    recipes = Recipe.objects.filter(author_id=author_id).order_by(
+        '-date', '-pk').values_list('pk', 'date')[:settings.FEED_BACKFILL]
+    insert(FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                     author_id=author_id, date=date)
+           for recipe_id, date in recipes)
+
+
+def prune(user_id, author_id):
+    '''Убирает рецепты автора из ленты отписавшегося'''
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+@transaction.atomic
+def rebuild():
+    '''Пересобирает все ленты по подпискам'''
+    FeedEntry.objects.all().delete()
+    recent = defaultdict(list)
+    recipes = Recipe.objects.annotate(row_number=Window(
+        RowNumber(),
+        partition_by=F('author'),
+        order_by=(F('date').desc(), F('pk').desc()),
+    )).filter(row_number__lte=settings.FEED_BACKFILL).values_list(
+        'author_id', 'pk', 'date')
+    for author_id, recipe_id, date in recipes.iterator(
+            chunk_size=BATCH_SIZE):
+        recent[author_id].append((recipe_id, date))
+    follows = Follow.objects.values_list('user_id', 'author_id').order_by()
+    insert(FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                     author_id=author_id, date=date)
+           for user_id, author_id in follows.iterator(chunk_size=BATCH_SIZE)
+           for recipe_id, date in recent[author_id])
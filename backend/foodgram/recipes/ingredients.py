@@ -0,0 +1,78 @@
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count, Min
+from recipes.models import Ingredient, RecipeIngredient, ShoppingListItem
+
+# Строки со ссылкой на ингредиент и поле, уникальное вместе с ним
+REFERENCES = (
+    (RecipeIngredient, 'recipe_id'),
+    (ShoppingListItem, 'user_id'),
+)
+
+
+def duplicates(using=DEFAULT_DB_ALIAS):
+    '''Лишние ингредиенты вида {pk: pk оставляемого с тем же ключом}'''
+    ingredients = Ingredient.objects.using(using)
+    groups = (ingredients.order_by().values('name', 'measurement_unit')
+              .annotate(keep=Min('pk'), total=Count('pk'))
+              .filter(total__gt=1))
+    replaced = {}
+    for group in groups:
+        for pk in ingredients.filter(
+                name=group['name'],
+                measurement_unit=group['measurement_unit'],
+        ).exclude(pk=group['keep']).values_list('pk', flat=True):
+            replaced[pk] = group['keep']
+    return replaced
+
+
+def repoint(model, owner, replaced, using):
+    '''
+    Переносит строки на оставляемый ингредиент. Если у владельца уже
+    есть строка с ним, количества складываются, а лишняя удаляется.
+    '''
+    rows = (model.objects.using(using)
+            .filter(ingredient_id__in={*replaced, *replaced.values()})
+            .order_by('pk')
+            .values_list('pk', owner, 'ingredient_id', 'amount'))
+    survivors, deleted = {}, []
+    for pk, owner_id, ingredient_id, amount in rows:
+        key = (owner_id, replaced.get(ingredient_id, ingredient_id))
+        survivor = survivors.get(key)
+        if survivor is None:
+            survivors[key] = {'pk': pk, 'amount': amount,
+                              'changed': ingredient_id != key[1]}
+        else:
+            survivor['amount'] += amount
+            survivor['changed'] = True
+            deleted.append(pk)
+    model.objects.using(using).filter(pk__in=deleted).delete()
+    for (_, ingredient_id), survivor in survivors.items():
+        if survivor['changed']:
+            model.objects.using(using).filter(pk=survivor['pk']).update(
+                ingredient_id=ingredient_id, amount=survivor['amount'])
+
+
+def merge_duplicates(using=DEFAULT_DB_ALIAS):
+    '''
+    Сливает ингредиенты с одинаковыми названием и единицей измерения
+    в ингредиент с меньшим pk. Выполняется перед миграциями, иначе
+    ограничение unique_ingredient не создастся на базе с дублями.
+    Возвращает число удалённых ингредиентов.
+    '''
+    tables = connections[using].introspection.table_names()
+    if Ingredient._meta.db_table not in tables:
+        return 0
+    with transaction.atomic(using=using):
+        replaced = duplicates(using)
+        if not replaced:
+            return 0
+        for model, owner in REFERENCES:
+            if model._meta.db_table in tables:
+                repoint(model, owner, replaced, using)
+        # Без сигналов удаления: таблиц версий и кеша ответов до миграций
+        # может ещё не быть, ссылок на эти ингредиенты уже нет
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {Ingredient._meta.db_table} WHERE id IN '
+                f'({", ".join(["%s"] * len(replaced))})', list(replaced))
+    return len(replaced)
@@ -1,6 +1,7 @@
 from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import (Exists, Index, OuterRef, Prefetch,
+                              UniqueConstraint, Value)
 from users.models import User
 
 
@@ -37,11 +38,44 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ('pk',)
+        constraints = (
+            UniqueConstraint(fields=('name', 'measurement_unit'),
+                             name='unique_ingredient'),
+        )
 
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    '''Кверисет рецептов'''
+
+    def with_viewer_flags(self, user):
+        '''Флаги избранного и корзины текущего пользователя'''
+        if user.is_anonymous:
+            return self.annotate(is_favorited=Value(False),
+                                 is_in_shopping_cart=Value(False))
+        return self.annotate(
+            is_favorited=Exists(Favourite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+        )
+
+    def for_read(self):
+        '''
+        Рецепты со всеми связями, число запросов не зависит
+        от количества рецептов. Флаги текущего пользователя
+        сериализаторы берут из api.viewer.ViewerState.
+        '''
+        return self.select_related('author').prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.order_by('pk')),
+            Prefetch('recipeingredient',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient').order_by('pk')),
+        )
+
+
 class Recipe(models.Model):
     '''Модель рецепта'''
 
@@ -67,11 +101,26 @@ class Recipe(models.Model):
         validators=[MinValueValidator(1, message='Минимальное значение - 1!')])
     date = models.DateTimeField(verbose_name='Дата публикации',
                                 auto_now_add=True)
+    updated = models.DateTimeField(verbose_name='Дата изменения',
+                                   auto_now=True)
+    favourites_count = models.PositiveIntegerField(
+        verbose_name='В избранном', default=0, editable=False)
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name='В корзинах', default=0, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-date',)
+        indexes = (
+            Index(fields=('-date', '-id'), name='recipe_date'),
+            Index(fields=('author', '-date'), name='recipe_author_date'),
+            Index(fields=('updated',), name='recipe_updated'),
+            Index(fields=('-favourites_count', '-date', '-id'),
+                  name='recipe_popular'),
+        )
 
     def __str__(self):
         return str(self.name)
@@ -98,6 +147,10 @@ class RecipeIngredient(models.Model):
             UniqueConstraint(fields=('recipe', 'ingredient'),
                              name='recipeingredient'),
         )
+        indexes = (
+            Index(fields=('ingredient', 'recipe'),
+                  name='recipeingredient_reverse'),
+        )
 
     def __str__(self):
         return f'{str(self.ingredient)} in {str(self.recipe)}-{self.amount}'
@@ -122,6 +175,9 @@ class Favourite(models.Model):
             UniqueConstraint(fields=('user', 'recipe'),
                              name='unique_favourite'),
         )
+        indexes = (
+            Index(fields=('recipe', 'user'), name='favourite_reverse'),
+        )
 
     def __str__(self):
         return f'Добавлено в избранное {self.recipe}'
@@ -146,6 +202,73 @@ class ShoppingCart(models.Model):
             UniqueConstraint(fields=('user', 'recipe'),
                              name='unique_shopping_cart'),
         )
+        indexes = (
+            Index(fields=('recipe', 'user'), name='shopping_cart_reverse'),
+        )
 
     def __str__(self):
         return f'Добавлено в корзину {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    '''
+    Суммарное количество ингредиента в списке покупок пользователя.
+    Поддерживается при изменении корзины и ингредиентов рецептов.
+    '''
+
+    user = models.ForeignKey(User,
+                             verbose_name='Пользователь',
+                             on_delete=models.CASCADE,
+                             related_name='shopping_list')
+    ingredient = models.ForeignKey(Ingredient,
+                                   verbose_name='Ингредиент',
+                                   on_delete=models.CASCADE,
+                                   related_name='shopping_list')
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = (
+            UniqueConstraint(fields=('user', 'ingredient'),
+                             name='unique_shopping_list_item'),
+        )
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.amount}'
+
+
+class FeedEntry(models.Model):
+    '''
+    Рецепт в ленте подписчика его автора.
+    Заполняется при публикации рецепта и при подписке.
+    '''
+
+    user = models.ForeignKey(User,
+                             verbose_name='Подписчик',
+                             on_delete=models.CASCADE,
+                             related_name='feed')
+    recipe = models.ForeignKey(Recipe,
+                               verbose_name='Рецепт',
+                               on_delete=models.CASCADE,
+                               related_name='feed_entries')
+    author = models.ForeignKey(User,
+                               verbose_name='Автор',
+                               on_delete=models.CASCADE,
+                               related_name='+')
+    date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = (
+            UniqueConstraint(fields=('user', 'recipe'),
+                             name='unique_feed_entry'),
+        )
+        indexes = (
+            Index(fields=('user', '-date', '-recipe'), name='feed_user_date'),
+            Index(fields=('user', 'author'), name='feed_user_author'),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
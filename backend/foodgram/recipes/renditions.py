@@ -0,0 +1,99 @@
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+from recipes.models import Recipe
+
+# Размер и способ масштабирования: crop обрезает до точного размера,
+# иначе изображение вписывается в рамку без увеличения.
+RENDITIONS = {
+    'thumbnail': ((160, 160), True),
+    'card': ((480, 320), True),
+    'full': ((1280, 1280), False),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def rendition_name(image_name, size, fmt):
+    '''
+    Имя версии включает полное имя исходника с расширением: у разных
+    файлов, например temp.jpeg и temp.png, версии не должны совпадать.
+    '''
+    return f'renditions/{image_name}_{size}.{fmt}'
+
+
+def rendition_names(image_name):
+    return {size: {fmt: rendition_name(image_name, size, fmt)
+                   for fmt in FORMATS}
+            for size in RENDITIONS}
+
+
+def generate(image_name, storage=default_storage):
+    '''Создаёт все версии изображения рецепта'''
+    with storage.open(image_name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    for size, ((width, height), crop) in RENDITIONS.items():
+        if crop:
+            resized = ImageOps.fit(image, (width, height),
+                                   Image.Resampling.LANCZOS)
+        else:
+            resized = image.copy()
+            resized.thumbnail((width, height), Image.Resampling.LANCZOS)
+        for fmt, (pil_format, params) in FORMATS.items():
+            converted = resized.convert('RGBA' if fmt == 'webp'
+                                        and resized.mode in ('RGBA', 'LA', 'P')
+                                        else 'RGB')
+            buffer = BytesIO()
+            converted.save(buffer, pil_format, **params)
+            name = rendition_name(image_name, size, fmt)
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def missing(image_name, storage=default_storage):
+    '''Версии создаются вместе, последняя записанная служит маркером'''
+    last_size, last_format = list(RENDITIONS)[-1], list(FORMATS)[-1]
+    return not storage.exists(
+        rendition_name(image_name, last_size, last_format))
+
+
+def existing(image_name, storage=default_storage):
+    '''Имена готовых версий изображения или None, пока их нет'''
+    if missing(image_name, storage):
+        return None
+    return rendition_names(image_name)
+
+
+def ensure(image_name, storage=default_storage):
+    '''
+    Задача воркера: создаёт отсутствующие версии изображения. Если
+    исходник недоступен, возвращается None.
+    '''
+    if not missing(image_name, storage):
+        return rendition_names(image_name)
+    try:
+        generate(image_name, storage)
+    except (OSError, ValueError):
+        return None
+    # Ответы с рецептом закешированы без версий: сохранение сбрасывает
+    # кеш ответов и меняет ETag
+    for recipe in Recipe.objects.filter(image=image_name):
+        recipe.save(update_fields=('updated',))
+    return rendition_names(image_name)
+
+
+def remove(image_name, storage=default_storage):
+    '''Удаляет изображение и его версии, если рецептов с ним не осталось'''
+    if Recipe.objects.filter(image=image_name).exists():
+        return False
+    for formats in rendition_names(image_name).values():
+        for name in formats.values():
+            storage.delete(name)
+    storage.delete(image_name)
+    return True
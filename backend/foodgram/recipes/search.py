@@ -0,0 +1,120 @@
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'recipes_recipe_fts'
+WORD = re.compile(r'\w+')
+
+# Колонка вычисляется самой БД при каждом сохранении рецепта,
+# название весомее текста
+POSTGRES_SCHEMA = (
+    '''
+    ALTER TABLE recipes_recipe ADD COLUMN IF NOT EXISTS search_vector
+    tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('{config}', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('{config}', coalesce(text, '')), 'B')
+    ) STORED
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS recipe_search ON recipes_recipe
+    USING gin (search_vector)
+    ''',
+)
+# Внешнее содержимое FTS5 синхронизируется триггерами
+SQLITE_TABLE = f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, text, content='recipes_recipe', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')
+'''
+SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_insert': f'''
+        CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON recipes_recipe
+        BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, text)
+            VALUES (new.id, new.name, new.text);
+        END
+    ''',
+    f'{FTS_TABLE}_delete': f'''
+        CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON recipes_recipe
+        BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+            VALUES ('delete', old.id, old.name, old.text);
+        END
+    ''',
+    f'{FTS_TABLE}_update': f'''
+        CREATE TRIGGER {FTS_TABLE}_update
+        AFTER UPDATE OF name, text ON recipes_recipe
+        BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+            VALUES ('delete', old.id, old.name, old.text);
+            INSERT INTO {FTS_TABLE}(rowid, name, text)
+            VALUES (new.id, new.name, new.text);
+        END
+    ''',
+}
+
+
+def install(using):
+    '''Создаёт поисковый индекс, вызывается после каждой миграции'''
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            config = settings.SEARCH_CONFIG
+            if not WORD.fullmatch(config):
+                raise ValueError(f'Некорректная конфигурация поиска {config}')
+            for sql in POSTGRES_SCHEMA:
+                cursor.execute(sql.format(config=config))
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                'AND tbl_name = %s', ('recipes_recipe',))
+            existing = {row[0] for row in cursor.fetchall()}
+            if existing.issuperset(SQLITE_TRIGGERS):
+                return
+            # Пересборка таблицы миграцией удаляет её триггеры
+            cursor.execute(SQLITE_TABLE)
+            for name, sql in SQLITE_TRIGGERS.items():
+                if name not in existing:
+                    cursor.execute(sql)
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def search(queryset, query):
+    '''
+    Рецепты, подходящие под запрос, с релевантностью в search_rank.
+    Отбор идёт по индексу, ранжируются только найденные строки.
+    '''
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        tsquery = 'websearch_to_tsquery(%s::regconfig, %s)'
+        params = (settings.SEARCH_CONFIG, query)
+        queryset = queryset.filter(RawSQL(
+            f'"recipes_recipe"."search_vector" @@ {tsquery}', params,
+            output_field=BooleanField(),
+        )).annotate(search_rank=RawSQL(
+            f'ts_rank("recipes_recipe"."search_vector", {tsquery})', params,
+            output_field=FloatField(),
+        ))
+    elif vendor == 'sqlite':
+        # Каждое слово - префикс в кавычках, синтаксис FTS5 недоступен
+        match = ' '.join(f'"{word}"*' for word in WORD.findall(query))
+        if not match:
+            return queryset.none()
+        queryset = queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,),
+        )).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s '
+            f'AND {FTS_TABLE}.rowid = "recipes_recipe"."id"',
+            (match,), output_field=FloatField(),
+        ))
+    else:
+        queryset = queryset.filter(
+            Q(name__icontains=query) | Q(text__icontains=query)
+        ).annotate(search_rank=Value(0.0))
+    return queryset.order_by('-search_rank', '-date', '-pk')
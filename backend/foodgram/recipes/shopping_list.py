@@ -0,0 +1,170 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Sum
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+from users.models import User
+
+BATCH_SIZE = 1000
+
+
+def recipe_amounts(recipe_id):
+    '''Количество каждого ингредиента рецепта'''
+    return Counter(dict(RecipeIngredient.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', 'amount')))
+
+
+@transaction.atomic
+def apply_changes(changes):
+    '''
+    Применяет изменения вида {user_id: {ingredient_id: delta}}
+    к спискам покупок за постоянное число запросов.
+    '''
+    changes = {user_id: deltas for user_id, deltas in changes.items()
+               if any(deltas.values())}
+    if not changes:
+        return
+    # Блокировка пользователей упорядочивает параллельные изменения
+    # одного списка: иначе два добавления нового ингредиента не увидят
+    # строк друг друга и второе упадёт на unique_shopping_list_item.
+    # Порядок по pk исключает взаимоблокировки при изменении рецепта
+    list(User.objects.select_for_update().filter(
+        pk__in=changes).order_by('pk').values_list('pk', flat=True))
+    ingredient_ids = {ingredient_id for deltas in changes.values()
+                      for ingredient_id in deltas}
+    items = {
+        (item.user_id, item.ingredient_id): item
+        for item in ShoppingListItem.objects.select_for_update().filter(
+            user_id__in=changes, ingredient_id__in=ingredient_ids)
+    }
+    created, updated, deleted = [], [], []
+    for user_id, deltas in changes.items():
+        for ingredient_id, delta in deltas.items():
+            if not delta:
+                continue
+            item = items.get((user_id, ingredient_id))
+            if item is None:
+                if delta > 0:
+                    created.append(ShoppingListItem(
+                        user_id=user_id, ingredient_id=ingredient_id,
+                        amount=delta))
+                continue
+            item.amount += delta
+            if item.amount > 0:
+                updated.append(item)
+            else:
+                deleted.append(item.pk)
+    ShoppingListItem.objects.bulk_create(created, batch_size=BATCH_SIZE)
+    ShoppingListItem.objects.bulk_update(updated, ('amount',),
+                                         batch_size=BATCH_SIZE)
+    ShoppingListItem.objects.filter(pk__in=deleted).delete()
+
+
+def add_recipe(user_id, recipe_id):
+    apply_changes({user_id: recipe_amounts(recipe_id)})
+
+
+def remove_recipe(user_id, recipe_id):
+    amounts = recipe_amounts(recipe_id)
+    apply_changes({user_id: {ingredient_id: -amount
+                             for ingredient_id, amount in amounts.items()}})
+
+
+def change_recipe(recipe_id, old_amounts, new_amounts):
+    '''Переносит изменение ингредиентов рецепта во все корзины с ним'''
+    deltas = Counter(new_amounts)
+    deltas.subtract(old_amounts)
+    deltas = {ingredient_id: delta
+              for ingredient_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    user_ids = ShoppingCart.objects.filter(
+        recipe_id=recipe_id).values_list('user_id', flat=True)
+    apply_changes({user_id: deltas for user_id in user_ids})
+
+
+def remove_carts(carts):
+    '''
+    Вычитает из списков покупок рецепты корзин из запроса carts
+    одним агрегирующим запросом, например при удалении рецепта.
+    '''
+    changes = defaultdict(dict)
+    for user_id, ingredient_id, total in (
+        RecipeIngredient.objects
+        .filter(recipe__shopping_cart__in=carts)
+        .values_list('recipe__shopping_cart__user', 'ingredient')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    ):
+        changes[user_id][ingredient_id] = -total
+    if changes:
+        apply_changes(changes)
+
+
+@contextmanager
+def changing(recipe_ids):
+    '''
+    Переносит в корзины изменения ингредиентов рецептов, сделанные
+    внутри блока в обход RecipeCreateSerializer, например в админке.
+    '''
+    with transaction.atomic():
+        old = {recipe_id: recipe_amounts(recipe_id)
+               for recipe_id in recipe_ids}
+        yield
+        for recipe_id, amounts in old.items():
+            change_recipe(recipe_id, amounts, recipe_amounts(recipe_id))
+
+
+def expected_items():
+    '''Эталонные позиции списков покупок по корзинам'''
+    return (
+        RecipeIngredient.objects
+        .filter(recipe__shopping_cart__isnull=False)
+        .values_list('recipe__shopping_cart__user', 'ingredient')
+        .annotate(total=Sum('amount'))
+        .order_by('recipe__shopping_cart__user', 'ingredient')
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+
+
+def stored_items():
+    return (
+        ShoppingListItem.objects
+        .values_list('user', 'ingredient', 'amount')
+        .order_by('user', 'ingredient')
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+
+
+def verify():
+    '''
+    Расхождения между сохранёнными и эталонными списками покупок
+    в виде {(user_id, ingredient_id): (stored, expected)}.
+    '''
+    drift = {}
+    stored = defaultdict(int)
+    for user_id, ingredient_id, amount in stored_items():
+        stored[user_id, ingredient_id] = amount
+    for user_id, ingredient_id, total in expected_items():
+        amount = stored.pop((user_id, ingredient_id), 0)
+        if amount != total:
+            drift[user_id, ingredient_id] = (amount, total)
+    for key, amount in stored.items():
+        drift[key] = (amount, 0)
+    return drift
+
+
+@transaction.atomic
+def rebuild():
+    '''Пересобирает все списки покупок по корзинам'''
+    ShoppingListItem.objects.all().delete()
+    batch = []
+    for user_id, ingredient_id, total in expected_items():
+        batch.append(ShoppingListItem(user_id=user_id,
+                                      ingredient_id=ingredient_id,
+                                      amount=total))
+        if len(batch) >= BATCH_SIZE:
+            ShoppingListItem.objects.bulk_create(batch)
+            batch = []
+    ShoppingListItem.objects.bulk_create(batch)
@@ -0,0 +1,107 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_delete, pre_migrate)
+from django.dispatch import receiver
+from jobs.queue import enqueue
+from recipes import (counters, feed, ingredients, renditions, search,
+                     shopping_list)
+from recipes.models import Favourite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+
+@receiver(post_save, sender=Favourite)
+def recipe_favourited(sender, instance, created, **kwargs):
+    if created:
+        counters.change(Recipe, instance.recipe_id, 'favourites_count', 1)
+
+
+@receiver(post_delete, sender=Favourite)
+def recipe_unfavourited(sender, instance, origin=None, **kwargs):
+    counters.change(Recipe, instance.recipe_id, 'favourites_count', -1,
+                    origin)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def recipe_added_to_cart(sender, instance, created, **kwargs):
+    if created:
+        shopping_list.add_recipe(instance.user_id, instance.recipe_id)
+        counters.change(Recipe, instance.recipe_id, 'shopping_cart_count', 1)
+
+
+def deleted_with(origin, *models):
+    '''Удаление начато с объекта или запроса одной из моделей'''
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, models)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def recipe_removed_from_cart(sender, instance, origin=None, **kwargs):
+    # Корзины удаляемого рецепта вычитает recipe_deleting одним запросом,
+    # список покупок удаляемого пользователя удаляется каскадом
+    if deleted_with(origin, Recipe, User):
+        return
+    # pre_delete срабатывает до каскадного удаления ингредиентов рецепта
+    shopping_list.remove_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def cart_item_deleted(sender, instance, origin=None, **kwargs):
+    counters.change(Recipe, instance.recipe_id, 'shopping_cart_count', -1,
+                    origin)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change(User, instance.author_id, 'recipes_count', 1)
+        transaction.on_commit(lambda: feed.publish(instance))
+    # Версии изображения создаёт воркер, до этого в ответе их нет
+    if instance.image and renditions.missing(instance.image.name):
+        enqueue('recipes.renditions.ensure', instance.image.name)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, origin=None, **kwargs):
+    # Рецепты удаляемого автора вычитает author_deleting одним запросом
+    if deleted_with(origin, User):
+        return
+    shopping_list.remove_carts(ShoppingCart.objects.filter(recipe=instance))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, origin=None, **kwargs):
+    counters.change(User, instance.author_id, 'recipes_count', -1, origin)
+    if instance.image:
+        enqueue('recipes.renditions.remove', instance.image.name)
+
+
+@receiver(pre_delete, sender=User)
+def author_deleting(sender, instance, **kwargs):
+    shopping_list.remove_carts(ShoppingCart.objects.filter(
+        recipe__author=instance).exclude(user=instance))
+
+
+@receiver(post_save, sender=Follow)
+def author_followed(sender, instance, created, **kwargs):
+    if created:
+        counters.change(User, instance.author_id, 'followers_count', 1)
+        feed.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def author_unfollowed(sender, instance, origin=None, **kwargs):
+    counters.change(User, instance.author_id, 'followers_count', -1, origin)
+    feed.prune(instance.user_id, instance.author_id)
+
+
+@receiver(pre_migrate)
+def merge_duplicate_ingredients(sender, using, **kwargs):
+    if sender.label == 'recipes':
+        ingredients.merge_duplicates(using)
+
+
+@receiver(post_migrate)
+def install_search(sender, using, **kwargs):
+    if sender.label == 'recipes':
+        search.install(using)
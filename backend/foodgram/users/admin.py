@@ -7,13 +7,20 @@ EMPTY_VALUE = '-пусто-'
 @admin.register(Follow)
 class FolowAdmin(admin.ModelAdmin):
     list_display = ('pk', 'user', 'author')
-    search_fields = ('user', 'author')
+    list_select_related = ('user', 'author')
+    search_fields = ('user__username', 'user__email',
+                     'author__username', 'author__email')
+    autocomplete_fields = ('user', 'author')
+    show_full_result_count = False
 
 
 @admin.register(User)
 class UsersAdmin(admin.ModelAdmin):
     list_display = ('username', 'email', 'first_name',
-                    'last_name', 'password',)
+                    'last_name', 'password', 'recipes_count',
+                    'followers_count')
     search_fields = ('username', 'email',)
-    list_filter = ('username', 'email',)
+    list_filter = ('is_staff', 'is_active')
+    readonly_fields = ('recipes_count', 'followers_count')
     empty_value = EMPTY_VALUE
+    show_full_result_count = False
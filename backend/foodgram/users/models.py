@@ -1,7 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import Index, UniqueConstraint
 
 
 class User(AbstractUser):
@@ -23,6 +23,12 @@ class User(AbstractUser):
                                  max_length=150)
     password = models.CharField(verbose_name='Пароль',
                                 max_length=150)
+    recipes_count = models.PositiveIntegerField(verbose_name='Рецептов',
+                                                default=0,
+                                                editable=False)
+    followers_count = models.PositiveIntegerField(verbose_name='Подписчиков',
+                                                  default=0,
+                                                  editable=False)
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -57,6 +63,9 @@ class Follow(models.Model):
             UniqueConstraint(fields=('user', 'author'),
                              name='unique_subscription'),
         )
+        indexes = (
+            Index(fields=('author', 'user'), name='subscription_reverse'),
+        )
 
     def __str__(self):
         return self.user